@@ -0,0 +1,11 @@
+import os
+
+# Serve the async versions of the hot views
+os.environ.setdefault("ASYNC_VIEWS", "1")
+
+from captains_log import create_app
+from captains_log.asgi import ThreadedWsgiToAsgi
+
+app = ThreadedWsgiToAsgi(
+    create_app(), threads=int(os.environ.get("GUNICORN_THREADS", 8))
+)
@@ -0,0 +1,81 @@
+"""Benchmark that compares the requests needed to explore a planet through the HTML forms and through the JSON API.
+Run from the project's root folder: python benchmarks/api_round_trips.py [number of planets]"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.models import User
+
+PLANETS = 200
+THINGS_TO_DISCOVER = 6
+
+
+def explore_html(client):
+    """Function that explores a planet like a browser, following every redirect.
+    Returns the number of requests sent."""
+
+    requests = 2
+    url = client.post(
+        "/explore", data={"things_to_discover": THINGS_TO_DISCOVER}
+    ).headers["Location"]
+    client.get(url)
+    for number in range(1, THINGS_TO_DISCOVER + 1):
+        url = client.post(url, data={"description": f"Discovery {number}"}).headers[
+            "Location"
+        ]
+        client.get(url)
+        requests += 2
+    client.post(url, data={"name": "Bench"})
+    return requests + 1
+
+
+def explore_api(client):
+    """Function that explores a planet through the API: one request for the prompts, one for the descriptions.
+    Returns the number of requests sent."""
+
+    planet = client.post(
+        "/api/v1/planets", json={"things_to_discover": THINGS_TO_DISCOVER}
+    ).get_json()["planet"]
+    response = client.post(
+        f"/api/v1/planets/{planet['id']}/discoveries",
+        json={
+            "descriptions": [
+                f"Discovery {discovery['number']}"
+                for discovery in planet["discoveries"]
+            ],
+            "name": "Bench",
+        },
+    )
+    assert response.status_code == 200, response.get_json()
+    return 2
+
+
+def main():
+    planets = int(sys.argv[1]) if len(sys.argv) > 1 else PLANETS
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email="explorer@example.com", password="unused"))
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+
+    print(f"{planets} planets of {THINGS_TO_DISCOVER} discoveries")
+    for name, explore in (("html", explore_html), ("api", explore_api)):
+        start = time.perf_counter()
+        requests = sum(explore(client) for _ in range(planets))
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<5}{requests / planets:>5.0f} requests per planet, "
+            f"{elapsed * 1000 / planets:.1f} ms per planet"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark that counts db commits issued by each request of the explore flow.
+Run from the project's root folder: python benchmarks/commits_per_request.py"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.models import User
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+THINGS_TO_DISCOVER = 6
+
+commits = 0
+
+
+@event.listens_for(Session, "after_commit")
+def count_commit(session):
+    global commits
+    commits += 1
+
+
+def measure(client, method, url, **kwargs):
+    """Function that sends a request and returns the number of commits it issued"""
+
+    global commits
+    commits = 0
+    response = client.open(url, method=method, **kwargs)
+    assert response.status_code in (200, 302), response.status_code
+    return commits
+
+
+def main():
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email="explorer@example.com", password="unused"))
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+
+    results = [
+        (
+            "explore",
+            measure(
+                client,
+                "POST",
+                "/explore",
+                data={"things_to_discover": THINGS_TO_DISCOVER},
+            ),
+        )
+    ]
+    for number in range(1, THINGS_TO_DISCOVER + 1):
+        results.append(
+            (
+                f"discovery {number}",
+                measure(
+                    client,
+                    "POST",
+                    f"/explore/1/{number}",
+                    data={"description": f"Discovery {number}"},
+                ),
+            )
+        )
+
+    for step, count in results:
+        print(f"{step:<15} {count} commit(s)")
+    print(f"{'max':<15} {max(count for _, count in results)} commit(s) per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark that measures bytes on the wire and time to first byte of a large planet page,
+with and without compression and template streaming.
+Run from the project's root folder: python benchmarks/compression.py [number of discoveries]"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import TestingConfig
+
+DISCOVERIES = 1000
+RUNS = 20
+WORDS = (
+    "crater ocean forest ruins signal crystal storm moon river cave "
+    "glacier beacon creature tower desert fungus volcano wreck aurora reef"
+).split()
+
+
+def seed(discoveries):
+    """Function that inserts a user with a single archived planet of long discoveries"""
+
+    rng = random.Random(0)
+    db.session.execute(
+        db.text("INSERT INTO user (id, email, password) VALUES (1, 'a@b.com', 'x')")
+    )
+    db.session.execute(
+        db.text(
+            "INSERT INTO planet (id, name, things_to_discover, user_id, status, version) "
+            "VALUES (1, 'Large Planet', :things, 1, 'archived', 1)"
+        ),
+        {"things": discoveries},
+    )
+    db.session.execute(
+        db.text(
+            "INSERT INTO discovery (number, circumstances, thing_discovered, description, planet_id) "
+            "VALUES (:number, 'x', 'x', :description, 1)"
+        ),
+        [
+            {"number": number, "description": " ".join(rng.choices(WORDS, k=300))}
+            for number in range(1, discoveries + 1)
+        ],
+    )
+    db.session.commit()
+
+
+def measure(discoveries, compression, streaming):
+    """Function that requests the planet page RUNS times.
+    Returns the bytes received, and the median time to first byte and to the last byte in milliseconds."""
+
+    class BenchmarkConfig(TestingConfig):
+        COMPRESSION_ENABLED = compression
+        STREAM_TEMPLATES = streaming
+        # Render the discovery list on every request
+        FRAGMENT_CACHE_BACKEND = "null"
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        seed(discoveries)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+
+    first_bytes, last_bytes = [], []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        response = client.get(
+            "/archive/1", headers={"Accept-Encoding": "gzip"}, buffered=False
+        )
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        first_bytes.append((time.perf_counter() - start) * 1000)
+        size += sum(len(chunk) for chunk in chunks)
+        response.close()
+        last_bytes.append((time.perf_counter() - start) * 1000)
+    return size, statistics.median(first_bytes), statistics.median(last_bytes)
+
+
+def main():
+    discoveries = int(sys.argv[1]) if len(sys.argv) > 1 else DISCOVERIES
+    print(f"planet page with {discoveries} discoveries")
+    print(
+        f"{'compression':>12}{'streaming':>10}{'KB on wire':>12}{'TTFB ms':>9}{'total ms':>10}"
+    )
+    for compression in (False, True):
+        for streaming in (False, True):
+            size, first_byte, last_byte = measure(discoveries, compression, streaming)
+            print(
+                f"{'gzip' if compression else 'off':>12}{'on' if streaming else 'off':>10}"
+                f"{size / 1024:>12.1f}{first_byte:>9.1f}{last_byte:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Benchmark that compares gunicorn's sync workers with threaded workers, and with the ASGI app served by uvicorn
+workers with async views, while requests wait on the database.
+A delay is added to every SQL statement to stand in for the round trips to a remote Postgres server.
+Reports requests per second and the memory of the server per request it can serve concurrently.
+The ASGI setups are skipped unless uvicorn, asgiref and aiosqlite are installed.
+Run from the project's root folder (Linux only): python benchmarks/concurrency.py [latency in ms per statement]"""
+
+import asyncio
+import http.client
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+from threading import Thread
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import engine_options, TestingConfig
+from captains_log.hashing import hash_password
+from captains_log.models import Planet, User
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.util import await_only
+
+LATENCY_MS = 5
+PORT = 8765
+CLIENTS = 16
+DURATION = 10
+# (name, gunicorn options, app), each serving at most 16 requests at a time
+SETUPS = (
+    (
+        "sync, 16 workers",
+        ["--worker-class", "sync", "--workers", "16"],
+        "standin_app()",
+    ),
+    (
+        "gthread, 2x8",
+        ["--worker-class", "gthread", "--workers", "2", "--threads", "8"],
+        "standin_app()",
+    ),
+    (
+        "gthread, 1x16",
+        ["--worker-class", "gthread", "--workers", "1", "--threads", "16"],
+        "standin_app()",
+    ),
+    (
+        "uvicorn, 2x8",
+        ["--worker-class", "uvicorn.workers.UvicornWorker", "--workers", "2"],
+        "standin_asgi_app()",
+    ),
+    (
+        "uvicorn, 1x16",
+        ["--worker-class", "uvicorn.workers.UvicornWorker", "--workers", "1"],
+        "standin_asgi_app()",
+    ),
+)
+# Threads per worker of the ASGI setups
+THREADS = {"uvicorn, 2x8": 8, "uvicorn, 1x16": 16}
+
+
+def config(database_url, async_views=False):
+    """Function that returns the configuration of the app served by gunicorn"""
+
+    class StandInConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        ASYNC_VIEWS = async_views
+        # Connections are shared by the threads of a worker through the pool
+        SQLALCHEMY_ENGINE_OPTIONS = dict(
+            engine_options(database_url),
+            connect_args={"check_same_thread": False},
+            pool_size=16,
+        )
+        LAZY_LOAD_DETECTION = None
+
+    return StandInConfig
+
+
+def add_latency():
+    """Function that adds a delay before every SQL statement.
+    Statements of the asyncio engine wait in the event loop, so that other requests are served meanwhile."""
+
+    latency = float(os.environ["STANDIN_LATENCY_MS"]) / 1000
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def wait_for_database(conn, *args):
+        if conn.dialect.is_async:
+            await_only(asyncio.sleep(latency))
+        else:
+            time.sleep(latency)
+
+
+def standin_app():
+    """Function called by gunicorn to create the app, with a delay before every SQL statement"""
+
+    app = create_app(config(os.environ["STANDIN_DATABASE_URL"]))
+    add_latency()
+    return app
+
+
+def standin_asgi_app():
+    """Function called by gunicorn to create the ASGI app of asgi.py with async views,
+    with a delay before every SQL statement"""
+
+    from captains_log.asgi import ThreadedWsgiToAsgi
+
+    app = create_app(config(os.environ["STANDIN_DATABASE_URL"], async_views=True))
+    add_latency()
+    return ThreadedWsgiToAsgi(app, int(os.environ["STANDIN_THREADS"]))
+
+
+def asgi_available():
+    """Function that checks whether the packages needed by the ASGI setups are installed"""
+
+    return all(
+        importlib.util.find_spec(name) is not None
+        for name in ("uvicorn", "asgiref", "aiosqlite")
+    )
+
+
+def seed(database_url):
+    """Function that creates a user with a few archived planets"""
+
+    app = create_app(config(database_url))
+    with app.app_context():
+        db.create_all()
+        db.session.add(
+            User(email="explorer@example.com", password=hash_password("Abcde1"))
+        )
+        db.session.add_all(
+            Planet(
+                name=f"Planet {id}",
+                things_to_discover=1,
+                user_id=1,
+                status=Planet.ARCHIVED,
+            )
+            for id in range(1, 21)
+        )
+        db.session.commit()
+
+
+def login():
+    """Function that logs in and returns the session cookie"""
+
+    connection = http.client.HTTPConnection("127.0.0.1", PORT)
+    connection.request(
+        "POST",
+        "/login",
+        "email=explorer%40example.com&password=Abcde1",
+        {"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    response = connection.getresponse()
+    cookie = response.getheader("Set-Cookie").split(";")[0]
+    connection.close()
+    return cookie
+
+
+def load(cookie, deadline, results):
+    """Function run by client threads: requests the archive page until the deadline"""
+
+    completed = 0
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection("127.0.0.1", PORT)
+        connection.request("GET", "/archive", headers={"Cookie": cookie})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        assert response.status == 200, response.status
+        completed += 1
+    results.append(completed)
+
+
+def rss(pid):
+    """Function that returns the resident memory in MB of a process and its children"""
+
+    with open(f"/proc/{pid}/status") as file:
+        kb = next(int(line.split()[1]) for line in file if line.startswith("VmRSS"))
+    with open(f"/proc/{pid}/task/{pid}/children") as file:
+        children = [int(child) for child in file.read().split()]
+    return kb / 1024 + sum(rss(child) for child in children)
+
+
+def wait_until_ready():
+    """Function that waits for gunicorn to accept connections"""
+
+    for _ in range(100):
+        try:
+            http.client.HTTPConnection("127.0.0.1", PORT).request("GET", "/about")
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn didn't start")
+
+
+def measure(options, app, threads, database_url, latency):
+    """Function that starts gunicorn with the given options and loads it with CLIENTS concurrent clients.
+    Returns requests per second and the memory of the server in MB."""
+
+    benchmarks = os.path.dirname(os.path.abspath(__file__))
+    env = dict(
+        os.environ,
+        STANDIN_DATABASE_URL=database_url,
+        STANDIN_LATENCY_MS=str(latency),
+        STANDIN_THREADS=str(threads),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{PORT}"]
+        + ["--pythonpath", benchmarks]
+        + options
+        + [f"concurrency:{app}"],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready()
+        cookie = login()
+        results = []
+        deadline = time.monotonic() + DURATION
+        clients = [
+            Thread(target=load, args=(cookie, deadline, results))
+            for _ in range(CLIENTS)
+        ]
+        for client in clients:
+            client.start()
+        time.sleep(DURATION / 2)
+        memory = rss(server.pid)
+        for client in clients:
+            client.join()
+        return sum(results) / DURATION, memory
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else LATENCY_MS
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'standin.db')}"
+    seed(database_url)
+    print(f"{CLIENTS} clients, {latency} ms per SQL statement, {DURATION} s per setup")
+    print(f"{'setup':<18}{'requests/s':>11}{'MB':>8}{'MB per slot':>13}")
+    for name, options, app in SETUPS:
+        if app == "standin_asgi_app()" and not asgi_available():
+            print(f"{name:<18}  skipped, uvicorn, asgiref or aiosqlite isn't installed")
+            continue
+        requests, memory = measure(
+            options, app, THREADS.get(name, 1), database_url, latency
+        )
+        print(f"{name:<18}{requests:>11.1f}{memory:>8.1f}{memory / CLIENTS:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
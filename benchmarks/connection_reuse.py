@@ -0,0 +1,81 @@
+"""Benchmark that shows pooled database connections are reused across requests.
+Uses a temporary SQLite file unless --database points to another database,
+whose tables are dropped and recreated, which must be confirmed with --yes-drop.
+Run from the project's root folder: python benchmarks/connection_reuse.py [--database URL --yes-drop]"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import TestingConfig
+from captains_log.models import User
+from captains_log.profiling import pool_stats
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+REQUESTS = 500
+
+connects = 0
+
+
+@event.listens_for(Pool, "connect")
+def count_connect(dbapi_connection, connection_record):
+    global connects
+    connects += 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database", help="database to use instead of a temporary SQLite file"
+    )
+    parser.add_argument(
+        "--yes-drop",
+        action="store_true",
+        help="confirm that every table of --database can be dropped",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.database and not args.yes_drop:
+        sys.exit(
+            "The tables of --database are dropped before seeding it. Pass --yes-drop to confirm."
+        )
+
+    class ConnectionReuseConfig(TestingConfig):
+        # Pool settings only apply to file-based databases
+        SQLALCHEMY_DATABASE_URI = args.database or (
+            f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        )
+
+    app = create_app(ConnectionReuseConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(email="explorer@example.com", password="unused"))
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+
+    for _ in range(REQUESTS):
+        assert client.get("/archive").status_code == 200
+
+    with app.app_context():
+        stats = pool_stats(db.engine)
+    print(f"requests: {REQUESTS}")
+    print(f"connections opened: {connects}")
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark that shows streaming a logbook export uses constant memory regardless of its size.
+Run from the project's root folder: python benchmarks/export.py [number of discoveries ...]"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+
+DEFAULT_SIZES = (1000, 10_000, 100_000)
+DISCOVERIES_PER_PLANET = 6
+BATCH_SIZE = 10_000
+
+
+def seed(discoveries):
+    """Function that inserts a single user with the given number of logged discoveries"""
+
+    db.session.execute(
+        db.text("INSERT INTO user (id, email, password) VALUES (1, 'a@b.com', 'x')")
+    )
+    planets = -(-discoveries // DISCOVERIES_PER_PLANET)
+    db.session.execute(
+        db.text(
+            "INSERT INTO planet (id, name, things_to_discover, user_id, status, version) "
+            "VALUES (:id, :name, :things, 1, 'archived', 1)"
+        ),
+        [
+            {"id": id, "name": f"Planet {id}", "things": DISCOVERIES_PER_PLANET}
+            for id in range(1, planets + 1)
+        ],
+    )
+    for start in range(0, discoveries, BATCH_SIZE):
+        db.session.execute(
+            db.text(
+                "INSERT INTO discovery (id, number, circumstances, thing_discovered, "
+                "description, planet_id) VALUES (:id, :number, 'x', 'x', :description, :planet_id)"
+            ),
+            [
+                {
+                    "id": id + 1,
+                    "number": id % DISCOVERIES_PER_PLANET + 1,
+                    "description": f"Discovery {id} " * 20,
+                    "planet_id": id // DISCOVERIES_PER_PLANET + 1,
+                }
+                for id in range(start, min(start + BATCH_SIZE, discoveries))
+            ],
+        )
+    db.session.commit()
+
+
+def measure(discoveries, export_format):
+    """Function that streams an export through the test client.
+    Returns the bytes streamed, the peak traced memory and the elapsed time."""
+
+    app = create_app("testing")
+    app.config[
+        "SQLALCHEMY_DATABASE_URI"
+    ] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    with app.app_context():
+        db.create_all()
+        seed(discoveries)
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(f"/archive/export?format={export_format}", buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    print(
+        f"{'discoveries':>12}{'format':>10}{'MB streamed':>13}{'peak MB':>9}{'seconds':>9}"
+    )
+    for discoveries in sizes:
+        for export_format in ("ndjson", "markdown"):
+            size, peak, elapsed = measure(discoveries, export_format)
+            print(
+                f"{discoveries:>12}{export_format:>10}{size / 2**20:>13.1f}"
+                f"{peak / 2**20:>9.2f}{elapsed:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark that compares cold and warm views of an archived planet page.
+Fails if rendering the discovery list issues any SQL statement on a warm hit.
+Run from the project's root folder: python benchmarks/fragment_cache.py"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db, fragment_cache
+from captains_log.discoveries.utils import render_discoveries
+from captains_log.models import Discovery, Planet, User
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+THINGS_TO_DISCOVER = 6
+REQUESTS = 200
+
+statements = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+def discovery_queries():
+    """Function that returns the number of recorded statements that read discoveries"""
+
+    return sum("FROM discovery" in statement for statement in statements)
+
+
+def main():
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email="explorer@example.com", password="unused"))
+        planet = Planet(things_to_discover=THINGS_TO_DISCOVER, user_id=1)
+        planet.archive()
+        db.session.add(planet)
+        db.session.flush()
+        for number in range(1, THINGS_TO_DISCOVER + 1):
+            db.session.add(
+                Discovery(
+                    number=number,
+                    circumstances="You come upon it suddenly",
+                    thing_discovered="A ruin in the desert",
+                    description=f"Discovery {number} " * 100,
+                    planet_id=planet.id,
+                )
+            )
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+
+    for label in ("cold", "warm"):
+        statements.clear()
+        response = client.get("/archive/1")
+        assert response.status_code == 200, response.status_code
+        print(
+            f"{label:<5} {len(statements)} queries, "
+            f"{discovery_queries()} discovery queries"
+        )
+
+    # The page itself loads the user and the planet, rendering the cached list must not add anything
+    with app.test_request_context():
+        planet = Planet.query.get(1)
+        statements.clear()
+        render_discoveries(planet)
+        assert not statements, statements
+        print("warm hit: 0 statements to render the discovery list")
+
+    for label, backend in (("cached", "lru"), ("uncached", "null")):
+        app.config["FRAGMENT_CACHE_BACKEND"] = backend
+        fragment_cache.init_app(app)
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get("/archive/1")
+        elapsed = time.perf_counter() - start
+        print(f"{label:<8} {elapsed / REQUESTS * 1000:.2f} ms per request")
+
+    print(f"hits={fragment_cache.hits} misses={fragment_cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
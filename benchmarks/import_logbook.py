@@ -0,0 +1,64 @@
+"""Benchmark that measures logbook import throughput on SQLite for several batch sizes.
+Run from the project's root folder: python benchmarks/import_logbook.py [number of discoveries]"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.discoveries.importer import import_logbook
+from captains_log.models import User
+
+DISCOVERIES = 300_000
+DISCOVERIES_PER_PLANET = 6
+BATCH_SIZES = (1000, 5000, 20_000)
+
+
+def write_logbook(path, discoveries):
+    """Function that writes a synthetic logbook in the export format"""
+
+    with open(path, "w") as file:
+        for planet_id in range(discoveries // DISCOVERIES_PER_PLANET):
+            planet = {
+                "name": f"Planet {planet_id}",
+                "things_to_discover": DISCOVERIES_PER_PLANET,
+                "discoveries": [
+                    {
+                        "number": number,
+                        "circumstances": "You come upon it suddenly",
+                        "thing_discovered": "A ruin in the desert",
+                        "description": f"Discovery {number} on planet {planet_id}. "
+                        * 5,
+                    }
+                    for number in range(1, DISCOVERIES_PER_PLANET + 1)
+                ],
+            }
+            file.write(json.dumps(planet) + "\n")
+
+
+def main():
+    discoveries = int(sys.argv[1]) if len(sys.argv) > 1 else DISCOVERIES
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "logbook.ndjson")
+    write_logbook(path, discoveries)
+    print(f"logbook: {os.path.getsize(path) / 2**20:.1f} MB, {discoveries} discoveries")
+
+    for batch_size in BATCH_SIZES:
+        app = create_app("testing")
+        app.config[
+            "SQLALCHEMY_DATABASE_URI"
+        ] = f"sqlite:///{os.path.join(directory, f'bench{batch_size}.db')}"
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(email="explorer@example.com", password="unused"))
+            db.session.commit()
+            with open(path, "rb") as logbook:
+                stats = import_logbook(1, logbook, batch_size)
+        print(f"batch size {batch_size:>6}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark that measures the time to import the models and to build an app against a budget.
+Exits with status 1 when a budget is exceeded.
+Run from the project's root folder: python benchmarks/import_time.py"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RUNS = 5
+# Budgets in milliseconds, measured in a fresh interpreter
+BUDGETS = {
+    "import captains_log.models": 1000,
+    "create_app('testing')": 1500,
+}
+SCRIPTS = {
+    "import captains_log.models": "import captains_log.models",
+    "create_app('testing')": (
+        "from captains_log import create_app; create_app('testing')"
+    ),
+}
+# Prints the time spent running the script, excluding interpreter startup
+TIMER = "import time; start = time.perf_counter(); {script}; print(time.perf_counter() - start)"
+
+
+def measure(script):
+    """Function that returns the median time in milliseconds to run a script in a fresh interpreter"""
+
+    times = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", TIMER.format(script=script)],
+            cwd=ROOT,
+            env={
+                key: value for key, value in os.environ.items() if key != "DATABASE_URL"
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        times.append(float(output.splitlines()[-1]) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    exceeded = False
+    for name, script in SCRIPTS.items():
+        elapsed = measure(script)
+        budget = BUDGETS[name]
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        exceeded = exceeded or elapsed > budget
+        print(f"{name:<30} {elapsed:>8.1f} ms (budget {budget} ms) {status}")
+    sys.exit(1 if exceeded else 0)
+
+
+if __name__ == "__main__":
+    main()
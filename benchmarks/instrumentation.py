@@ -0,0 +1,75 @@
+"""Benchmark that measures the overhead of per-request instrumentation, disabled and enabled.
+Run from the project's root folder: python benchmarks/instrumentation.py [number of requests]"""
+
+import os
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import TestingConfig
+from captains_log.models import User
+from captains_log.profiling import timed
+
+REQUESTS = 2000
+THINGS_TO_DISCOVER = 6
+
+
+def measure(instrumentation, requests):
+    """Function that explores a planet and then times requests to its page in the archive.
+    Returns the median latency in milliseconds."""
+
+    class BenchmarkConfig(TestingConfig):
+        INSTRUMENTATION = instrumentation
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email="explorer@example.com", password="unused"))
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1:1"
+        session["_fresh"] = True
+    url = client.post(
+        "/explore", data={"things_to_discover": THINGS_TO_DISCOVER}
+    ).headers["Location"]
+    for _ in range(THINGS_TO_DISCOVER):
+        url = client.post(url, data={"description": "x"}).headers["Location"]
+    url = client.post(url, data={"name": "Bench"}).headers["Location"]
+
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get(url)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+    disabled = measure(False, requests)
+    enabled = measure(True, requests)
+    print(f"planet page, instrumentation disabled: {disabled:.3f} ms (median)")
+    print(
+        f"planet page, instrumentation enabled:  {enabled:.3f} ms (median), "
+        f"{(enabled - disabled) / disabled:+.1%}"
+    )
+
+    # Cost of a timing hook around bcrypt or mail when instrumentation is disabled
+    app = create_app(TestingConfig)
+    with app.app_context():
+
+        def hook():
+            with timed("bcrypt"):
+                pass
+
+        seconds = timeit.timeit(hook, number=100_000) / 100_000
+    print(f"disabled timing hook: {seconds * 1_000_000:.2f} us per call")
+
+
+if __name__ == "__main__":
+    main()
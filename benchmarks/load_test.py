@@ -0,0 +1,284 @@
+"""Load test that drives the exploration and archive flows through the Flask test client.
+Seeds a synthetic dataset of users, planets and discoveries, then records for every step of the flows
+the p50/p99 latency, the number of SQL statements and the number of rows loaded per request.
+Uses a temporary SQLite file unless --database points to another database (e.g. a local Postgres),
+whose tables are dropped and recreated, which must be confirmed with --yes-drop.
+Results are written as JSON. With --baseline, the run fails if a step issues more queries than in the baseline.
+Run from the project's root folder: python benchmarks/load_test.py [--users N] [--planets N] [--discoveries N]"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import TestingConfig
+from captains_log.models import Discovery, Planet, User
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+BATCH_SIZE = 10_000
+WORDS = (
+    "crater ocean forest ruins signal crystal storm moon river cave "
+    "glacier beacon creature tower desert fungus volcano wreck aurora reef"
+).split()
+
+rows = 0
+
+
+@event.listens_for(Mapper, "load")
+@event.listens_for(Mapper, "refresh")
+def count_row(target, context, *args):
+    global rows
+    rows += 1
+
+
+def seed(users, planets, discoveries):
+    """Function that inserts users, each with archived planets full of logged discoveries.
+    Rows are inserted with explicit ids, in batches of BATCH_SIZE."""
+
+    rng = random.Random(0)
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            {"id": id, "email": f"user{id}@example.com", "password": "x"}
+            for id in range(1, users + 1)
+        ],
+    )
+    planet_rows = [
+        {
+            "id": id,
+            "name": f"Planet {id}",
+            "things_to_discover": discoveries,
+            "user_id": (id - 1) // planets + 1,
+            "status": Planet.ARCHIVED,
+            "version": 1,
+        }
+        for id in range(1, users * planets + 1)
+    ]
+    for start in range(0, len(planet_rows), BATCH_SIZE):
+        db.session.execute(
+            Planet.__table__.insert(), planet_rows[start : start + BATCH_SIZE]
+        )
+    total = users * planets * discoveries
+    for start in range(0, total, BATCH_SIZE):
+        db.session.execute(
+            Discovery.__table__.insert(),
+            [
+                {
+                    "id": id + 1,
+                    "number": id % discoveries + 1,
+                    "circumstances": "x",
+                    "thing_discovered": "x",
+                    "description": " ".join(rng.choices(WORDS, k=30)),
+                    "planet_id": id // discoveries + 1,
+                }
+                for id in range(start, min(start + BATCH_SIZE, total))
+            ],
+        )
+    # Move Postgres id sequences past the explicit ids
+    if db.engine.dialect.name == "postgresql":
+        for model in (User, Planet, Discovery):
+            table = model.__tablename__
+            db.session.execute(
+                db.text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                    f'(SELECT max(id) FROM "{table}"))'
+                )
+            )
+    db.session.commit()
+
+
+class Recorder:
+    """Class that sends requests and records their latency, query count and rows loaded by step"""
+
+    def __init__(self, client):
+        self.client = client
+        self.samples = {}
+
+    def open(self, step, method, url, **kwargs):
+        global rows
+        rows = 0
+        start = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - start
+        assert response.status_code in (200, 302), (step, url, response.status_code)
+        self.samples.setdefault(step, []).append(
+            (elapsed * 1000, int(response.headers["X-Query-Count"]), rows)
+        )
+        return response
+
+
+def explore_and_archive(recorder, discoveries, rng):
+    """Function that explores a new planet, logs all of its discoveries and names it,
+    then browses the archive and the newly archived planet"""
+
+    recorder.open("explore", "GET", "/explore")
+    response = recorder.open(
+        "start exploration",
+        "POST",
+        "/explore",
+        data={"things_to_discover": discoveries},
+    )
+    url = response.headers["Location"]
+    for number in range(1, discoveries + 1):
+        recorder.open("discovery", "GET", url)
+        response = recorder.open(
+            "log discovery",
+            "POST",
+            url,
+            data={"description": " ".join(rng.choices(WORDS, k=30))},
+        )
+        url = response.headers["Location"]
+    recorder.open("name planet", "GET", url)
+    response = recorder.open("archive planet", "POST", url, data={"name": "Bench"})
+    planet_url = response.headers["Location"]
+
+    recorder.open("archive", "GET", "/archive")
+    before = int(planet_url.rsplit("/", 1)[1])
+    recorder.open("archive next page", "GET", f"/archive?before={before}")
+    recorder.open("planet", "GET", planet_url)
+    recorder.open("planet (cached)", "GET", planet_url)
+
+
+def percentile(values, percent):
+    """Function that returns the nearest-rank percentile of sorted values"""
+
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(index)]
+
+
+def summarize(samples):
+    """Function that aggregates the samples of every step"""
+
+    summary = {}
+    for step, values in samples.items():
+        latencies = sorted(latency for latency, _, _ in values)
+        queries = [count for _, count, _ in values]
+        loaded = [count for _, _, count in values]
+        summary[step] = {
+            "requests": len(values),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "queries_mean": round(sum(queries) / len(queries), 2),
+            "queries_max": max(queries),
+            "rows_mean": round(sum(loaded) / len(loaded), 2),
+            "rows_max": max(loaded),
+        }
+    return summary
+
+
+def regressions(summary, baseline):
+    """Function that returns the steps that issue more queries than in the baseline results"""
+
+    return [
+        (step, baseline["steps"][step]["queries_max"], result["queries_max"])
+        for step, result in summary.items()
+        if step in baseline["steps"]
+        and result["queries_max"] > baseline["steps"][step]["queries_max"]
+    ]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--planets", type=int, default=50, help="planets per user")
+    parser.add_argument(
+        "--discoveries", type=int, default=6, help="discoveries per planet"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=50, help="flows run, each by a random user"
+    )
+    parser.add_argument(
+        "--database", help="database to use instead of a temporary SQLite file"
+    )
+    parser.add_argument(
+        "--yes-drop",
+        action="store_true",
+        help="confirm that every table of --database can be dropped",
+    )
+    parser.add_argument("--output", default="load_test.json")
+    parser.add_argument("--baseline", help="results of a previous run to compare to")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.database and not args.yes_drop:
+        sys.exit(
+            "The tables of --database are dropped before seeding it. Pass --yes-drop to confirm."
+        )
+    database = (
+        args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load_test.db')}"
+    )
+
+    class LoadTestConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database
+        QUERY_COUNT_HEADER = True
+
+    app = create_app(LoadTestConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        seed(args.users, args.planets, args.discoveries)
+        seconds = time.perf_counter() - start
+        dialect = db.engine.dialect.name
+        db.session.remove()
+    print(
+        f"seeded {args.users} users x {args.planets} planets x {args.discoveries} "
+        f"discoveries on {dialect} in {seconds:.1f} s"
+    )
+
+    rng = random.Random(1)
+    recorder = Recorder(app.test_client())
+    for _ in range(args.iterations):
+        with recorder.client.session_transaction() as session:
+            session["_user_id"] = f"{rng.randint(1, args.users)}:1"
+            session["_fresh"] = True
+        explore_and_archive(recorder, args.discoveries, rng)
+
+    summary = summarize(recorder.samples)
+    print(
+        f"{'step':<20}{'requests':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'queries':>9}{'max':>5}{'rows':>8}{'max':>6}"
+    )
+    for step, result in summary.items():
+        print(
+            f"{step:<20}{result['requests']:>9}{result['p50_ms']:>9.2f}"
+            f"{result['p99_ms']:>9.2f}{result['queries_mean']:>9.1f}"
+            f"{result['queries_max']:>5}{result['rows_mean']:>8.1f}{result['rows_max']:>6}"
+        )
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "database": dialect,
+                "dataset": {
+                    "users": args.users,
+                    "planets_per_user": args.planets,
+                    "discoveries_per_planet": args.discoveries,
+                },
+                "iterations": args.iterations,
+                "steps": summary,
+            },
+            file,
+            indent=2,
+        )
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            failed = regressions(summary, json.load(file))
+        for step, expected, actual in failed:
+            print(f"query count regression in {step}: {actual} > {expected}")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Benchmark that reports password checks (logins) per second per core at each bcrypt cost.
+Run from the project's root folder: python benchmarks/password_hashing.py [cost ...]"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log.hashing import _check, _hash
+
+PASSWORD = "Benchmark1"
+DEFAULT_COSTS = (10, 11, 12, 13)
+# Minimum time spent measuring each cost, in seconds
+DURATION = 2
+
+
+def logins_per_second(cost):
+    """Function that measures sequential password checks per second on a single core"""
+
+    hashed = _hash(PASSWORD, cost)
+    checks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        assert _check(hashed, PASSWORD)
+        checks += 1
+    return checks / (time.perf_counter() - start)
+
+
+def main():
+    costs = [int(cost) for cost in sys.argv[1:]] or DEFAULT_COSTS
+    print(f"{'cost':<6}{'logins/sec/core':>16}{'ms/login':>10}")
+    for cost in costs:
+        rate = logins_per_second(cost)
+        print(f"{cost:<6}{rate:>16.1f}{1000 / rate:>10.1f}")
+    print(f"cores: {os.cpu_count()}")
+
+
+if __name__ == "__main__":
+    main()
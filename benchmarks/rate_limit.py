@@ -0,0 +1,107 @@
+"""Benchmark that measures the overhead of the rate limiter per request, for each storage,
+and the cost of a rejected login attempt compared to one that reaches bcrypt.
+Run from the project's root folder: python benchmarks/rate_limit.py [number of requests]"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import Config, TestingConfig
+from captains_log.hashing import hash_password
+from captains_log.models import User
+from captains_log.ratelimit import MemoryStorage, SharedMemoryStorage
+
+REQUESTS = 2000
+KEYS = 10000
+# High enough that no request of the benchmark is rejected
+UNLIMITED = (10**9, 1)
+
+
+def storages():
+    """Function that returns the storages to compare, with the settings to select them"""
+
+    path = os.path.join(tempfile.mkdtemp(), "ratelimit")
+    return (
+        ("null", {"RATELIMIT_STORAGE": "null"}),
+        ("memory", {"RATELIMIT_STORAGE": "memory"}),
+        ("shared", {"RATELIMIT_STORAGE": "shared", "RATELIMIT_SHARED_PATH": path}),
+    )
+
+
+def take_microseconds(storage, calls):
+    """Function that returns the mean time in microseconds to take a token, cycling through KEYS keys"""
+
+    keys = [f"login:ip:10.0.{number // 256}.{number % 256}" for number in range(KEYS)]
+    start = time.perf_counter()
+    for number in range(calls):
+        storage.take(keys[number % KEYS], *UNLIMITED)
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def login_milliseconds(settings, requests, password="wrong", bcrypt_rounds=4):
+    """Function that returns the status and mean time in milliseconds of a login attempt of an existing user.
+    A first attempt is sent before timing, which also takes the only token of a limit of 1 request."""
+
+    class BenchmarkConfig(TestingConfig):
+        RATELIMIT_LOGIN_PER_IP = UNLIMITED
+        RATELIMIT_LOGIN_PER_EMAIL = UNLIMITED
+        BCRYPT_LOG_ROUNDS = bcrypt_rounds
+
+    for name, value in settings.items():
+        setattr(BenchmarkConfig, name, value)
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(
+            User(email="explorer@example.com", password=hash_password("Abcde1"))
+        )
+        db.session.commit()
+    client = app.test_client()
+    data = {"email": "explorer@example.com", "password": password}
+    client.post("/login", data=data)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.post("/login", data=data)
+    elapsed = time.perf_counter() - start
+    return response.status_code, elapsed * 1000 / requests
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+
+    print(f"taking a token, {requests * 100} calls over {KEYS} keys")
+    path = os.path.join(tempfile.mkdtemp(), "ratelimit")
+    for name, storage in (
+        ("memory", MemoryStorage()),
+        ("shared", SharedMemoryStorage(path, "benchmark")),
+    ):
+        print(f"{name:<8}{take_microseconds(storage, requests * 100):>8.2f} us")
+
+    print(f"\nPOST /login with a wrong password, {requests} requests")
+    baseline = None
+    for name, settings in storages():
+        _, milliseconds = login_milliseconds(settings, requests)
+        baseline = baseline or milliseconds
+        print(
+            f"{name:<8}{milliseconds:>8.3f} ms  "
+            f"+{(milliseconds - baseline) * 1000:.1f} us per request"
+        )
+
+    rounds = Config.BCRYPT_LOG_ROUNDS
+    print(f"\nPOST /login at the production bcrypt cost ({rounds} rounds)")
+    _, allowed = login_milliseconds({}, 20, bcrypt_rounds=rounds)
+    status, rejected = login_milliseconds(
+        {"RATELIMIT_LOGIN_PER_EMAIL": (1, 3600)}, 20, bcrypt_rounds=rounds
+    )
+    assert status == 429, status
+    print(f"{'checked':<9}{allowed:>8.2f} ms")
+    print(f"{'rejected':<9}{rejected:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
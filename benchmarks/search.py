@@ -0,0 +1,168 @@
+"""Benchmark that measures full-text search latency over a synthetic corpus of discoveries.
+Uses a temporary SQLite file unless --database points to another database,
+whose tables are dropped and recreated, which must be confirmed with --yes-drop.
+Run from the project's root folder: python benchmarks/search.py [number of discoveries] [--database URL --yes-drop]"""
+
+import argparse
+from itertools import accumulate
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from captains_log import create_app, db
+from captains_log.config import TestingConfig
+from captains_log.discoveries.search import search_discoveries
+
+DISCOVERIES = 1_000_000
+USERS = 1000
+DISCOVERIES_PER_PLANET = 6
+BATCH_SIZE = 10_000
+RUNS = 20
+PAGE_SIZE = 20
+# Budget for the median search, in milliseconds
+BUDGET = 50
+
+# Vocabulary of pseudo-words drawn with a Zipf distribution, like words in natural language
+VOCABULARY_SIZE = 20_000
+SYLLABLES = "ka lo mi ra ven tor sil da ne ur fa zo qui bel th ar on ex ly".split()
+
+
+def vocabulary(rng):
+    """Function that returns the vocabulary and the cumulative weights of its words"""
+
+    words = sorted(
+        {
+            "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+            for _ in range(VOCABULARY_SIZE * 2)
+        }
+    )[:VOCABULARY_SIZE]
+    rng.shuffle(words)
+    weights = accumulate(1 / rank for rank in range(1, len(words) + 1))
+    return words, list(weights)
+
+
+def seed(discoveries):
+    """Function that inserts users, planets and discoveries in batches"""
+
+    rng = random.Random(0)
+    words, weights = vocabulary(rng)
+    planets = discoveries // DISCOVERIES_PER_PLANET
+    db.session.execute(
+        db.text("INSERT INTO user (id, email, password) VALUES (:id, :email, 'x')"),
+        [{"id": id, "email": f"user{id}@example.com"} for id in range(1, USERS + 1)],
+    )
+    db.session.execute(
+        db.text(
+            "INSERT INTO planet (id, name, things_to_discover, user_id, status, version) "
+            "VALUES (:id, :name, :things, :user_id, 'archived', 1)"
+        ),
+        [
+            {
+                "id": id,
+                "name": f"Planet {id}",
+                "things": DISCOVERIES_PER_PLANET,
+                "user_id": id % USERS + 1,
+            }
+            for id in range(1, planets + 1)
+        ],
+    )
+    for start in range(0, discoveries, BATCH_SIZE):
+        db.session.execute(
+            db.text(
+                "INSERT INTO discovery (id, number, circumstances, thing_discovered, "
+                "description, planet_id) VALUES (:id, :number, 'x', 'x', :description, :planet_id)"
+            ),
+            [
+                {
+                    "id": id + 1,
+                    "number": id % DISCOVERIES_PER_PLANET + 1,
+                    "description": " ".join(
+                        rng.choices(words, cum_weights=weights, k=40)
+                    ),
+                    "planet_id": id // DISCOVERIES_PER_PLANET + 1,
+                }
+                for id in range(start, min(start + BATCH_SIZE, discoveries))
+            ],
+        )
+    db.session.commit()
+    return words
+
+
+def queries(rng, words):
+    """Function that returns search queries: a very common word, a common word,
+    a rare word and two-word combinations of them"""
+
+    common, frequent, rare = (
+        words[0],
+        words[rng.randint(10, 100)],
+        words[rng.randint(1000, 10_000)],
+    )
+    return (common, frequent, rare, f"{common} {frequent}", f"{frequent} {rare}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("discoveries", type=int, nargs="?", default=DISCOVERIES)
+    parser.add_argument(
+        "--database", help="database to use instead of a temporary SQLite file"
+    )
+    parser.add_argument(
+        "--yes-drop",
+        action="store_true",
+        help="confirm that every table of --database can be dropped",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.database and not args.yes_drop:
+        sys.exit(
+            "The tables of --database are dropped before seeding it. Pass --yes-drop to confirm."
+        )
+    discoveries = args.discoveries
+
+    class SearchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = args.database or (
+            f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        )
+
+    app = create_app(SearchConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        words = seed(discoveries)
+        print(
+            f"seeded {discoveries} discoveries in {time.perf_counter() - start:.1f} s"
+        )
+
+        rng = random.Random(1)
+        times = []
+        for _ in range(RUNS):
+            for query in queries(rng, words):
+                user_id = rng.randint(1, USERS)
+                start = time.perf_counter()
+                results = search_discoveries(user_id, query, PAGE_SIZE)
+                # Fetch the second page as well, to measure keyset pagination
+                if results:
+                    last = results[-1]
+                    search_discoveries(
+                        user_id, query, PAGE_SIZE, (last["rank"], last["id"])
+                    )
+                times.append((time.perf_counter() - start) * 1000 / 2)
+
+    times.sort()
+    median = statistics.median(times)
+    p99 = times[int(len(times) * 0.99) - 1]
+    print(f"searches: {len(times)}, p50 {median:.1f} ms, p99 {p99:.1f} ms")
+    print(f"budget {BUDGET} ms: {'ok' if median <= BUDGET else 'OVER BUDGET'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-from captains_log.config import Config
+from captains_log.cache import FragmentCache, UserCache
+from captains_log.config import profiles, resolve_database
 from flask import Flask
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_sqlalchemy import SQLAlchemy
+import os
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Initialize extensions without associating to app
 db = SQLAlchemy()
@@ -11,28 +14,100 @@ bcrypt = Bcrypt()
 login_manager = LoginManager()
 login_manager.login_view = "users.login"
 login_manager.login_message_category = "info"
+# API requests that aren't logged in get a 401 instead of a redirect to the login page
+login_manager.blueprint_login_views["api"] = None
 mail = Mail()
+fragment_cache = FragmentCache()
+user_cache = UserCache()
 
 
-def create_app(config_class=Config):
+def create_app(config_class=None):
+    """Application factory.
+    config_class is a configuration class or the name of a profile (development, testing or production).
+    It defaults to the profile named by the CAPTAINS_LOG_CONFIG environment variable, or production."""
+
     app = Flask(__name__)
-    # Configure app from Config class
-    app.config.from_object(Config)
+    # Configure app from profile
+    if config_class is None:
+        config_class = os.environ.get("CAPTAINS_LOG_CONFIG", "production")
+    if isinstance(config_class, str):
+        config_class = profiles[config_class]
+    app.config.from_object(config_class)
+    resolve_database(app)
+    # Get the client's IP address from the X-Forwarded-For header set by trusted proxies
+    if app.config["TRUSTED_PROXIES"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXIES"])
     # Associate extensions to app
     db.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    fragment_cache.init_app(app)
+    user_cache.init_app(app)
+    # Create the asyncio engine used by async views
+    from captains_log.asyncdb import async_db
+
+    async_db.init_app(app)
+    # Fingerprint static URLs and serve precompressed static files
+    from captains_log.assets import init_assets
+
+    init_assets(app)
+    # Compress responses, registered first so that it runs after every other after_request function
+    from captains_log.compression import init_compression
+
+    init_compression(app)
+    from captains_log.mailer import mail_queue
+
+    mail_queue.init_app(app)
+    # Limit the rate of login and password reset attempts
+    from captains_log.ratelimit import rate_limiter
+
+    rate_limiter.init_app(app)
+    # Expose per-request query counts, connection pool statistics and timings, and detect lazy load loops
+    from captains_log.profiling import (
+        init_instrumentation,
+        init_lazy_load_detection,
+        init_pool_logging,
+        init_query_counter,
+    )
+
+    init_query_counter(app)
+    init_pool_logging(app)
+    init_instrumentation(app)
+    init_lazy_load_detection(app)
     # Import blueprints
     from captains_log.main.routes import main
     from captains_log.users.routes import users
     from captains_log.discoveries.routes import discoveries
     from captains_log.errors.handlers import errors
+    from captains_log.api.routes import api
 
     # Register blueprints
     app.register_blueprint(main)
     app.register_blueprint(users)
     app.register_blueprint(discoveries)
     app.register_blueprint(errors)
+    app.register_blueprint(api)
+
+    # Register CLI commands
+    from captains_log.commands import (
+        build_assets,
+        create_indexes,
+        export_logbook,
+        import_logbook_command,
+        mail_worker,
+        migrate_planet_status,
+        normalize_emails,
+        upgrade_db,
+    )
+
+    app.cli.add_command(build_assets)
+    app.cli.add_command(create_indexes)
+    app.cli.add_command(export_logbook)
+    app.cli.add_command(import_logbook_command)
+    app.cli.add_command(mail_worker)
+    app.cli.add_command(migrate_planet_status)
+    app.cli.add_command(normalize_emails)
+    app.cli.add_command(upgrade_db)
 
     return app
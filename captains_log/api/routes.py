@@ -0,0 +1,207 @@
+from captains_log.api.utils import (
+    json_body,
+    logged_discoveries_by_planet,
+    planet_json,
+    read_only,
+    token_authenticated,
+)
+from captains_log.discoveries.utils import (
+    archive_page,
+    ExplorationConflict,
+    log_discoveries,
+    start_exploration,
+)
+from captains_log.models import Discovery, Planet, User
+from captains_log.prompts import PromptsExhausted
+from captains_log.ratelimit import rate_limited
+from captains_log.users.forms import normalize_email
+from captains_log.users.utils import exploration_state
+from flask import abort, Blueprint, current_app, jsonify, request, url_for
+from flask_login import current_user, login_required, login_user, logout_user
+from werkzeug.exceptions import HTTPException
+
+# Initialize Blueprint, versioned so that the API can change without breaking clients
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+# Maximum length of planet names, as in the planet name form
+NAME_MAX_LENGTH = 30
+
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    """View to return API errors as JSON instead of HTML pages"""
+
+    headers = {}
+    if getattr(error, "retry_after", None):
+        headers["Retry-After"] = error.retry_after
+    return jsonify(error=error.description), error.code, headers
+
+
+# Codes with an HTML page registered by the errors blueprint need their own handler to take precedence
+for code in (403, 404, 429, 500):
+    api.register_error_handler(code, api_error)
+
+
+@api.route("/login", methods=["POST"])
+@rate_limited("login")
+def login():
+    """View to log in with a JSON body of email, password and optionally remember.
+    The session cookie is returned with the response, without a prior request for a CSRF token."""
+
+    body = json_body()
+    email, password = body.get("email"), body.get("password")
+    if not isinstance(email, str) or not isinstance(password, str):
+        abort(400, "An email and a password are required.")
+    user = User.verify_credentials(normalize_email(email), password)
+    if not user:
+        abort(401, "Login unsuccessful. Please check your credentials.")
+    login_user(user, remember=bool(body.get("remember")))
+    return jsonify(user={"id": user.id, "email": user.email})
+
+
+@api.route("/tokens", methods=["POST"])
+@rate_limited("login")
+def create_token():
+    """View to get an auth token with a JSON body of email and password, for clients that don't keep cookies.
+    The token is sent as "Authorization: Bearer <token>" and is replaced by the one returned after each change
+    to the exploration, since read only views rely on the state it holds."""
+
+    body = json_body()
+    email, password = body.get("email"), body.get("password")
+    if not isinstance(email, str) or not isinstance(password, str):
+        abort(400, "An email and a password are required.")
+    user = User.verify_credentials(normalize_email(email), password)
+    if not user:
+        abort(401, "Login unsuccessful. Please check your credentials.")
+    return jsonify(
+        token=user.get_auth_token(),
+        expires_in=current_app.config["AUTH_TOKEN_MAX_AGE"],
+    )
+
+
+@api.route("/logout", methods=["POST"])
+def logout():
+    """View to log out"""
+
+    logout_user()
+    return "", 204
+
+
+@api.route("/planets", methods=["POST"])
+@exploration_state
+@login_required
+def start_planet():
+    """View to start exploring a planet, with a JSON body of things_to_discover (1 to 6).
+    Every discovery is created upfront and returned with its prompt, so that they can be logged in a single request."""
+
+    things_to_discover = json_body().get("things_to_discover")
+    if type(things_to_discover) is not int or not 1 <= things_to_discover <= 6:
+        abort(400, "things_to_discover must be an integer from 1 to 6.")
+    try:
+        planet = start_exploration(current_user, things_to_discover, upfront=True)
+    except ExplorationConflict:
+        abort(409, "A planet is already being explored.")
+    except PromptsExhausted as error:
+        abort(409, str(error))
+
+    discoveries = (
+        Discovery.query.filter_by(planet_id=planet.id).order_by(Discovery.number).all()
+    )
+    body = {"planet": planet_json(planet, discoveries)}
+    if token_authenticated():
+        body["token"] = current_user.get_auth_token()
+    response = jsonify(body)
+    response.status_code = 201
+    response.headers["Location"] = url_for("api.planet", planet_id=planet.id)
+    return response
+
+
+@api.route("/planets/current")
+@read_only
+@exploration_state
+@login_required
+def current_planet():
+    """View to get the planet being explored with all of its discoveries, logged or not"""
+
+    planet = current_user.current_planet
+    if planet is None:
+        abort(404, "No planet is being explored.")
+    discoveries = (
+        Discovery.query.filter_by(planet_id=planet.id).order_by(Discovery.number).all()
+    )
+    return jsonify(planet=planet_json(planet, discoveries))
+
+
+@api.route("/planets/<int:planet_id>/discoveries", methods=["POST"])
+@exploration_state
+@login_required
+def submit_discoveries(planet_id):
+    """View to log discoveries of the planet being explored in a single transaction.
+    The JSON body has descriptions, a list logged in order starting with the current discovery,
+    and optionally name, which archives the planet once every discovery is logged.
+    descriptions may be empty when a name is given, to archive a planet whose discoveries are all logged."""
+
+    body = json_body()
+    descriptions, name = body.get("descriptions"), body.get("name")
+    if (
+        not isinstance(descriptions, list)
+        or (not descriptions and name is None)
+        or not all(
+            isinstance(description, str) and description.strip()
+            for description in descriptions
+        )
+    ):
+        abort(
+            400,
+            "descriptions must be a list of non-empty strings, which is only empty when a name is given.",
+        )
+    if name is not None and (
+        not isinstance(name, str) or not name.strip() or len(name) > NAME_MAX_LENGTH
+    ):
+        abort(
+            400,
+            f"name must be a non-empty string of at most {NAME_MAX_LENGTH} characters.",
+        )
+    try:
+        planet = log_discoveries(current_user, planet_id, descriptions, name)
+    except ExplorationConflict as error:
+        abort(409, str(error))
+
+    discoveries = (
+        Discovery.query.filter_by(planet_id=planet.id).order_by(Discovery.number).all()
+    )
+    body = {"planet": planet_json(planet, discoveries)}
+    if token_authenticated():
+        body["token"] = current_user.get_auth_token()
+    return jsonify(body)
+
+
+@api.route("/planets")
+@read_only
+@login_required
+def planets():
+    """View to list the current user's archived planets with their logged discoveries, newest first.
+    The list is paginated with a cursor: ?before=<next_before of the previous page>&limit=N"""
+
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", current_app.config["ARCHIVE_PAGE_SIZE"], type=int)
+    limit = max(1, min(limit, current_app.config["ARCHIVE_MAX_PAGE_SIZE"]))
+
+    planets, next_before = archive_page(current_user.id, before, limit)
+    discoveries = logged_discoveries_by_planet(planets)
+    return jsonify(
+        planets=[planet_json(planet, discoveries[planet.id]) for planet in planets],
+        next_before=next_before,
+    )
+
+
+@api.route("/planets/<int:planet_id>")
+@read_only
+@login_required
+def planet(planet_id):
+    """View to get a planet of the current user with its logged discoveries"""
+
+    planet = Planet.query.get_or_404(planet_id)
+    if planet.user_id != current_user.id:
+        abort(403)
+    return jsonify(planet=planet_json(planet, planet.logged_discoveries))
@@ -0,0 +1,70 @@
+from captains_log.models import Discovery
+from flask import abort, request
+
+
+def read_only(view):
+    """Decorator that marks a view as not changing the user's state.
+    Requests to it authenticated with an auth token trust the claims in the token instead of loading the user."""
+
+    view.read_only = True
+    return view
+
+
+def token_authenticated():
+    """Function that returns whether the request is authenticated with an auth token rather than the session"""
+
+    return request.headers.get("Authorization", "").startswith("Bearer ")
+
+
+def json_body():
+    """Function that returns the JSON object sent with a request.
+    Requests must be sent as application/json, which browsers can't do cross-site without a CORS preflight,
+    so that cookie-authenticated API calls don't need a CSRF token."""
+
+    if not request.is_json:
+        abort(415, "Requests must be sent as application/json.")
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, "The request body must be a JSON object.")
+    return body
+
+
+def discovery_json(discovery):
+    """Function that serializes a discovery"""
+
+    return {
+        "number": discovery.number,
+        "circumstances": discovery.circumstances,
+        "thing_discovered": discovery.thing_discovered,
+        "description": discovery.description,
+    }
+
+
+def planet_json(planet, discoveries):
+    """Function that serializes a planet with the given discoveries"""
+
+    return {
+        "id": planet.id,
+        "name": planet.name,
+        "things_to_discover": planet.things_to_discover,
+        "status": planet.status,
+        "archived_at": planet.archived_at.isoformat() if planet.archived_at else None,
+        "discoveries": [discovery_json(discovery) for discovery in discoveries],
+    }
+
+
+def logged_discoveries_by_planet(planets):
+    """Function that loads the logged discoveries of several planets in a single query.
+    Returns a dict of lists of discoveries ordered by number, keyed by planet id."""
+
+    discoveries = {planet.id: [] for planet in planets}
+    if discoveries:
+        for discovery in (
+            Discovery.query.filter(
+                Discovery.planet_id.in_(discoveries), Discovery.description != None
+            )
+            .order_by(Discovery.planet_id, Discovery.number)
+            .all()
+        ):
+            discoveries[discovery.planet_id].append(discovery)
+    return discoveries
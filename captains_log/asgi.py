@@ -0,0 +1,31 @@
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """Class of the requests served by ThreadedWsgiToAsgi"""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        # asgiref runs the WSGI app of every request in the same thread
+        run = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(
+            self, body
+        )
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """ASGI app that serves a WSGI app from a pool of threads, while its async views run in the server's event loop"""
+
+    def __init__(self, wsgi_application, threads=8):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(threads)
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiToAsgiInstance(self.wsgi_application, self.executor)(
+            scope, receive, send
+        )
@@ -0,0 +1,132 @@
+from flask import current_app, request, send_from_directory
+import gzip
+import hashlib
+import mimetypes
+import os
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions of the static files worth compressing
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt")
+# Precompressed variants in order of preference, as (content coding, file suffix)
+PRECOMPRESSED_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+# Browsers keep files requested with their content hash for a year
+HASHED_MAX_AGE = 365 * 24 * 3600
+
+# Static file path -> (modification time, content hash)
+_hashes = {}
+
+
+def static_hash(filename):
+    """Function that returns a short hash of a static file's content, or None if the file doesn't exist.
+    Hashes are computed once per process, and again when the file changes in debug mode."""
+
+    path = safe_join(current_app.static_folder, filename)
+    cached = _hashes.get(path)
+    if cached is not None and not current_app.debug:
+        return cached[1]
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as file:
+            cached = _hashes[path] = (
+                mtime,
+                hashlib.sha256(file.read()).hexdigest()[:12],
+            )
+    return cached[1]
+
+
+def add_static_hash(endpoint, values):
+    """Function that adds the content hash of static files to their URLs as ?v=<hash>,
+    so that a changed file gets a new URL"""
+
+    if endpoint == "static" and "v" not in values:
+        digest = static_hash(values["filename"])
+        if digest is not None:
+            values["v"] = digest
+
+
+def precompressed_variant(filename):
+    """Function that returns the content coding and path of the best precompressed variant
+    of a static file that the client accepts, or None.
+    Variants older than the file itself are ignored, in case it changed since they were built."""
+
+    if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        return None
+    path = safe_join(current_app.static_folder, filename)
+    if path is None:
+        return None
+    for coding, suffix in PRECOMPRESSED_VARIANTS:
+        if not request.accept_encodings[coding]:
+            continue
+        try:
+            if os.stat(path + suffix).st_mtime_ns >= os.stat(path).st_mtime_ns:
+                return coding, filename + suffix
+        except OSError:
+            continue
+    return None
+
+
+def send_static(filename):
+    """View to serve static files, replacing Flask's default static view.
+    Precompressed variants are preferred when the client accepts them,
+    and files requested with their current content hash are cached for a year."""
+
+    variant = precompressed_variant(filename)
+    if variant is None:
+        response = current_app.send_static_file(filename)
+    else:
+        coding, variant_filename = variant
+        response = send_from_directory(
+            current_app.static_folder,
+            variant_filename,
+            mimetype=mimetypes.guess_type(filename)[0],
+        )
+        response.headers["Content-Encoding"] = coding
+    if filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        response.vary.add("Accept-Encoding")
+    if request.args.get("v") is not None and request.args["v"] == static_hash(filename):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = HASHED_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def precompress_static(folder):
+    """Function that writes gzip and, if the brotli package is installed, brotli variants
+    of the compressible files in a folder next to them. Variants that aren't smaller are skipped.
+    Returns the paths of the written files."""
+
+    compressors = [(".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        compressors.append((".br", lambda data: brotli.compress(data, quality=11)))
+    written = []
+    for root, _, filenames in os.walk(folder):
+        for filename in sorted(filenames):
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, "rb") as file:
+                data = file.read()
+            for suffix, compress in compressors:
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, "wb") as file:
+                    file.write(compressed)
+                written.append(path + suffix)
+    return written
+
+
+def init_assets(app):
+    """Function that fingerprints static URLs and serves static files with precompressed variants"""
+
+    app.url_defaults(add_static_hash)
+    app.view_functions["static"] = send_static
@@ -0,0 +1,61 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+# Async drivers used in place of the sync drivers of SQLALCHEMY_DATABASE_URI
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_uri(uri):
+    """Function that returns a database URI with the async driver of its dialect"""
+
+    url = make_url(uri)
+    dialect = url.get_backend_name()
+    if dialect not in ASYNC_DRIVERS:
+        raise RuntimeError(f"There is no async driver for {dialect} databases.")
+    return url.set(drivername=ASYNC_DRIVERS[dialect])
+
+
+class AsyncDatabase:
+    """Extension that gives async views sessions on SQLAlchemy's asyncio engine.
+    The engine is only created when ASYNC_VIEWS is enabled. Connections belong to the event loop that opened them,
+    and Flask runs each async view in an event loop of its own under a WSGI server, so they aren't pooled."""
+
+    def __init__(self, app=None):
+        self.engine = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config["ASYNC_VIEWS"]:
+            self.engine = None
+            return
+        uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        # Every connection to an in-memory database opens an empty one
+        if uri in ("sqlite://", "sqlite:///:memory:"):
+            raise RuntimeError("Async views can't use an in-memory SQLite database.")
+        self.engine = create_async_engine(async_database_uri(uri), poolclass=NullPool)
+
+    def session(self):
+        """Method that returns a new session, to be used as: async with async_db.session() as session.
+        Objects stay loaded after a commit, so that templates can render them once the session is closed."""
+
+        return AsyncSession(self.engine, expire_on_commit=False)
+
+
+async_db = AsyncDatabase()
+
+
+def async_version(blueprint, endpoint):
+    """Decorator for async versions of a blueprint's views.
+    The decorated view is served instead of the view of the endpoint when ASYNC_VIEWS is enabled."""
+
+    def decorator(view):
+        @blueprint.record
+        def use_async_version(state):
+            if state.app.config["ASYNC_VIEWS"]:
+                state.app.view_functions[f"{state.name}.{endpoint}"] = view
+
+        return view
+
+    return decorator
@@ -0,0 +1,234 @@
+from captains_log.shared_memory import SlotTable
+from collections import OrderedDict
+import json
+import struct
+from threading import Lock
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LRUCache:
+    """In-process cache backend with least recently used eviction and expiry"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            # Evict least recently used entries
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """Cache backend that stores entries in a Redis-compatible server shared by all workers"""
+
+    def __init__(self, url, ttl=3600, prefix="captains_log:"):
+        if redis is None:
+            raise RuntimeError(
+                "The redis package is required for the redis cache backend."
+            )
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else value.decode("utf-8")
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+def make_backend(backend, maxsize, ttl, redis_url, prefix):
+    """Function that creates a cache backend by name: "lru", "redis" or "null", which returns None"""
+
+    if backend == "lru":
+        return LRUCache(maxsize, ttl)
+    elif backend == "redis":
+        return RedisCache(redis_url, ttl, prefix)
+    elif backend == "null":
+        return None
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+class FragmentCache:
+    """Extension that caches rendered template fragments.
+    The backend is chosen by FRAGMENT_CACHE_BACKEND: "lru" (default), "redis" or "null" to disable caching."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        # Counters are updated by every thread of the worker
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_backend(
+            app.config["FRAGMENT_CACHE_BACKEND"],
+            app.config["FRAGMENT_CACHE_SIZE"],
+            app.config["FRAGMENT_CACHE_TTL"],
+            app.config["FRAGMENT_CACHE_REDIS_URL"],
+            "captains_log:",
+        )
+
+    def get(self, key):
+        """Method that returns a cached fragment, or None on a miss"""
+
+        value = self.backend.get(key) if self.backend is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def delete(self, key):
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+
+class SharedVersions:
+    """Table of the latest known version of users, in a table of slots shared by every worker of the host.
+    Slots are indexed by user id. A user takes over the slot of any other user with the same index,
+    whose version is then unknown. Without a path, the table is kept in the process."""
+
+    # User id, version
+    SLOT = struct.Struct("<QQ")
+
+    def __init__(self, path, slots=65536):
+        self.table = SlotTable(path, self.SLOT, slots)
+
+    def _update(self, user_id, version=None):
+        """Method that returns the version stored for a user, or None if it's unknown.
+        If version is given, it's stored first, unless a newer version already is."""
+
+        def update(slot):
+            stored_id, stored_version = slot
+            if stored_id != user_id:
+                stored_version = None
+            if version is not None and (
+                stored_version is None or version > stored_version
+            ):
+                return (user_id, version), version
+            return None, stored_version
+
+        return self.table.update(user_id, update)
+
+    def get(self, user_id):
+        return self._update(user_id)
+
+    def set(self, user_id, version):
+        self._update(user_id, version)
+
+
+class UserCache:
+    """Extension that caches the identity of users (id, email and version) so that views can skip loading the user.
+    Entries expire after USER_CACHE_TTL seconds. The backend is chosen by USER_CACHE_BACKEND:
+    "lru" (default) keeps a cache per worker, "redis" shares one between workers and "null" disables caching.
+    With "lru", a cached identity is only used while its version is the latest one known to the workers of the host,
+    shared in USER_CACHE_SHARED_PATH, so that every worker picks up a password reset on its next request."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.versions = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_backend(
+            app.config["USER_CACHE_BACKEND"],
+            app.config["USER_CACHE_SIZE"],
+            app.config["USER_CACHE_TTL"],
+            app.config["USER_CACHE_REDIS_URL"],
+            "captains_log:users:",
+        )
+        self.versions = None
+        if isinstance(self.backend, LRUCache):
+            self.versions = SharedVersions(
+                app.config["USER_CACHE_SHARED_PATH"],
+                app.config["USER_CACHE_SHARED_SLOTS"],
+            )
+
+    def get(self, user_id):
+        """Method that returns the cached identity of a user as a dict, or None on a miss.
+        An identity older than the latest version known to the workers is a miss."""
+
+        value = self.backend.get(str(user_id)) if self.backend is not None else None
+        if value is None:
+            return None
+        identity = json.loads(value)
+        if (
+            self.versions is not None
+            and self.versions.get(user_id) != identity["version"]
+        ):
+            return None
+        return identity
+
+    def set(self, user):
+        """Method that caches the identity of a user loaded from the db"""
+
+        if self.backend is not None:
+            if self.versions is not None:
+                self.versions.set(user.id, user.version)
+            self.backend.set(
+                str(user.id),
+                json.dumps(
+                    {"id": user.id, "email": user.email, "version": user.version}
+                ),
+            )
+
+    def invalidate(self, user):
+        """Method to call once a change of the user's version is committed.
+        Every worker then misses the user's cached identity on its next request, and loads the user."""
+
+        if self.backend is not None:
+            self.backend.delete(str(user.id))
+            if self.versions is not None:
+                self.versions.set(user.id, user.version)
@@ -0,0 +1,222 @@
+from captains_log import db
+from captains_log.assets import brotli, precompress_static
+from captains_log.discoveries.export import EXPORT_FORMATS
+from captains_log.discoveries.importer import import_logbook, LogbookError
+from captains_log.discoveries.search import create_search_index
+from captains_log.mailer import drain_db_queue, OutgoingEmail
+from captains_log.models import Discovery, Planet, User
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+import time
+
+MODELS = (User, Planet, Discovery, OutgoingEmail)
+
+
+def add_missing_columns():
+    """Function that adds the columns declared on the models that are missing from an existing db.
+    New non-nullable columns must declare a server default. Tables that don't exist yet are skipped,
+    they're added with all their columns by db.create_all().
+    Names, types and defaults are rendered by the dialect, which quotes reserved words such as user."""
+
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for model in MODELS:
+            table = model.__table__
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                connection.execute(
+                    db.text(
+                        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"
+                    )
+                )
+
+
+def create_missing_indexes():
+    """Function that creates the indexes declared on the models that are missing from an existing db"""
+
+    for model in MODELS:
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+@click.command("create-indexes")
+@with_appcontext
+def create_indexes():
+    """Create the indexes declared on the models that are missing from an existing db"""
+
+    create_missing_indexes()
+    click.echo("Indexes created.")
+
+
+@click.command("upgrade-db")
+@with_appcontext
+def upgrade_db():
+    """Add the tables, columns and indexes declared on the models that are missing from an existing db.
+    Also creates the full-text index of discovery descriptions."""
+
+    db.create_all()
+    add_missing_columns()
+    create_missing_indexes()
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    click.echo("Database upgraded.")
+
+
+@click.command("migrate-planet-status")
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def migrate_planet_status(batch_size):
+    """Add the planet status columns and backfill them for existing planets.
+    Planets that aren't any user's current planet are marked as archived.
+    Their archived_at stays null, as neither planets nor discoveries recorded when they were created.
+    Tables added since the db was created are created first, as upgrade-db does."""
+
+    db.create_all()
+    add_missing_columns()
+    create_missing_indexes()
+
+    # Planets currently being explored stay in the exploring status
+    current_planet_ids = db.session.query(User.current_planet_id).filter(
+        User.current_planet_id != None
+    )
+    # Backfill in batches of planet ids, committing after each batch
+    last_id = 0
+    updated = 0
+    while True:
+        batch = [
+            planet_id
+            for (planet_id,) in db.session.query(Planet.id)
+            .filter(Planet.id > last_id)
+            .order_by(Planet.id)
+            .limit(batch_size)
+        ]
+        if not batch:
+            break
+        last_id = batch[-1]
+        updated += Planet.query.filter(
+            Planet.id.in_(batch),
+            Planet.status != Planet.ARCHIVED,
+            Planet.id.notin_(current_planet_ids),
+        ).update({"status": Planet.ARCHIVED}, synchronize_session=False)
+        db.session.commit()
+
+    click.echo(
+        f"Marked {updated} planet(s) as archived, without an archive time (archived_at is null)."
+    )
+
+
+@click.command("mail-worker")
+@click.option("--once", is_flag=True, help="Exit once there are no due emails.")
+@click.option("--interval", default=5.0, show_default=True)
+@with_appcontext
+def mail_worker(once, interval):
+    """Send emails from the db-backed mail queue in batches"""
+
+    while True:
+        if drain_db_queue():
+            continue
+        if once:
+            break
+        time.sleep(interval)
+
+
+@click.command("normalize-emails")
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def normalize_emails(batch_size):
+    """Lowercase the emails of existing users in batches.
+    Emails that would collide with another account are reported and left unchanged."""
+
+    last_id = 0
+    updated = 0
+    while True:
+        batch = (
+            User.query.filter(User.id > last_id)
+            .order_by(User.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for user in batch:
+            email = user.email.strip().lower()
+            if email == user.email:
+                continue
+            if User.query.filter_by(email=email).first() is not None:
+                click.echo(f"Skipped user {user.id}: {email} is already registered.")
+                continue
+            user.email = email
+            # Flush so that later users in the batch see this email as taken
+            db.session.flush()
+            updated += 1
+        db.session.commit()
+
+    click.echo(f"Normalized {updated} email(s).")
+
+
+@click.command("export-logbook")
+@click.argument("email")
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(list(EXPORT_FORMATS)),
+    default="ndjson",
+)
+@click.option("--output", type=click.File("w"), default="-", show_default=True)
+@with_appcontext
+def export_logbook(email, export_format, output):
+    """Stream the logbook of the user with the given email"""
+
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if user is None:
+        raise click.ClickException(f"There is no account with the email {email}.")
+    generate = EXPORT_FORMATS[export_format][0]
+    for chunk in generate(user.id):
+        output.write(chunk)
+
+
+@click.command("import-logbook")
+@click.argument("email")
+@click.argument("logbook", type=click.File("rb"))
+@click.option("--batch-size", type=int, help="Rows per transaction.")
+@with_appcontext
+def import_logbook_command(email, logbook, batch_size):
+    """Import a logbook exported as JSON Lines into the archive of the user with the given email"""
+
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if user is None:
+        raise click.ClickException(f"There is no account with the email {email}.")
+    try:
+        stats = import_logbook(
+            user.id, logbook, batch_size or current_app.config["IMPORT_BATCH_SIZE"]
+        )
+    except LogbookError as error:
+        db.session.rollback()
+        raise click.ClickException(f"Import stopped. {error}")
+    click.echo(stats)
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets():
+    """Write precompressed variants of the static files, to be served to clients that accept them.
+    Brotli variants are only written if the brotli package is installed. Run again whenever static files change."""
+
+    written = precompress_static(current_app.static_folder)
+    for path in written:
+        click.echo(path)
+    if brotli is None:
+        click.echo(
+            "The brotli package isn't installed, only gzip variants were written."
+        )
+    click.echo(f"Wrote {len(written)} precompressed file(s).")
@@ -0,0 +1,110 @@
+from flask import current_app, request
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def choose_encoding():
+    """Function that returns the content coding to compress the response with, or None.
+    Brotli is preferred when the client accepts it and the brotli package is installed."""
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compressor(encoding):
+    """Function that returns the compress, flush and finish functions of an incremental compressor"""
+
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=current_app.config["BROTLI_QUALITY"])
+        return compressor.process, compressor.flush, compressor.finish
+    # A window of 16 + 15 bits makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(
+        current_app.config["GZIP_LEVEL"], zlib.DEFLATED, 16 + zlib.MAX_WBITS
+    )
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def compress_stream(chunks, charset, encoding, flush_size):
+    """Generator that compresses a streamed response body.
+    The compressor is flushed whenever flush_size bytes were added since the last flush,
+    so that the client receives the page while it's generated. The original body is closed at the end."""
+
+    compress, flush, finish = compressor(encoding)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += flush()
+                pending = 0
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response):
+    """Function that compresses responses whose mimetype is listed in COMPRESSION_MIMETYPES.
+    Bodies smaller than COMPRESSION_MIN_SIZE are sent as is, streamed bodies are compressed as they're sent.
+    Strong ETags are made weak, since the compressed body isn't byte-for-byte the same representation."""
+
+    config = current_app.config
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or request.method == "HEAD"
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in config["COMPRESSION_MIMETYPES"]
+        or response.cache_control.no_transform
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(
+            response.response,
+            response.charset,
+            encoding,
+            config["COMPRESSION_STREAM_FLUSH_SIZE"],
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESSION_MIN_SIZE"]:
+            return response
+        compress, _, finish = compressor(encoding)
+        response.set_data(compress(data) + finish())
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Function that compresses responses with gzip or brotli, unless COMPRESSION_ENABLED is off"""
+
+    if app.config["COMPRESSION_ENABLED"]:
+        app.after_request(compress_response)
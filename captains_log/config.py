@@ -1,18 +1,216 @@
+from captains_log.profiling import TimedQueuePool
+from datetime import datetime
 import os
+import tempfile
 
-alchemy_uri = os.environ.get("DATABASE_URL")
-if alchemy_uri.startswith("postgres://"):
-    alchemy_uri = alchemy_uri.replace("postgres://", "postgresql://", 1)
+# Folder of the files shared in memory by the workers of a host
+SHARED_MEMORY_FOLDER = (
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+
+
+def engine_options(uri):
+    """Function that builds SQLAlchemy engine options from environment variables.
+    Pool sizing only applies to databases that aren't in-memory SQLite."""
+
+    options = {
+        # Test connections on checkout, to survive database restarts
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+        # Replace connections older than this many seconds
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        # Number of compiled statements kept per engine and reused across requests
+        "query_cache_size": int(os.environ.get("DB_QUERY_CACHE_SIZE", 500)),
+    }
+    if uri in ("sqlite://", "sqlite:///:memory:"):
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        pool_timeout=int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+    )
+    return options
 
 
 class Config:
     """Class to handle app configuration"""
 
     SECRET_KEY = os.environ.get("SECRET_KEY")
-    SQLALCHEMY_DATABASE_URI = alchemy_uri
+    # Database URI, read from DATABASE_URL in create_app when not set by the profile
+    SQLALCHEMY_DATABASE_URI = None
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Log connection pool statistics at most every this many seconds (0 to disable)
+    DB_POOL_LOG_INTERVAL = int(os.environ.get("DB_POOL_LOG_INTERVAL", 0))
+    # Cost factor of password hashes, existing hashes are rehashed on login when it changes
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    # Serve async versions of the archive, planet and login views, which query the db with SQLAlchemy's asyncio engine
+    # Enabled by asgi.py, requires the asyncpg or aiosqlite driver
+    ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS") == "1"
+    # Hash passwords in a pool of processes ("process") or in the request thread ("inline")
+    HASHING_EXECUTOR = os.environ.get("HASHING_EXECUTOR", "process")
+    # Number of hashing processes, defaults to the number of cores
+    HASHING_WORKERS = int(os.environ.get("HASHING_WORKERS", 0))
     MAIL_SERVER = "smtp.googlemail.com"
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
     MAIL_DEFAULT_SENDER = os.environ.get("MAIL_USERNAME")
+    # Outgoing mail queue ("thread", "db" or "sync") and transport ("smtp", "console" or "file")
+    MAIL_QUEUE_BACKEND = os.environ.get("MAIL_QUEUE_BACKEND", "thread")
+    MAIL_QUEUE_WORKERS = 2
+    MAIL_TRANSPORT = os.environ.get("MAIL_TRANSPORT", "smtp")
+    MAIL_FILE_PATH = os.environ.get("MAIL_FILE_PATH", "mail.log")
+    MAIL_BATCH_SIZE = 20
+    MAIL_MAX_RETRIES = 5
+    # Base delay in seconds between retries, doubled after each attempt
+    MAIL_RETRY_BACKOFF = 2
+    # Number of seconds API auth tokens are valid for
+    AUTH_TOKEN_MAX_AGE = 3600
+    # Blueprints whose views load the user's current planet and discovery along with the user
+    EAGER_LOAD_BLUEPRINTS = ("discoveries", "api")
+    # Number of planets per archive page, and the maximum that can be requested with ?limit=
+    ARCHIVE_PAGE_SIZE = 20
+    ARCHIVE_MAX_PAGE_SIZE = 100
+    # Number of discoveries per page of search results
+    SEARCH_PAGE_SIZE = 20
+    # Number of rows fetched at a time when exporting a logbook
+    EXPORT_BATCH_SIZE = 1000
+    # Number of rows written per transaction when importing a logbook
+    IMPORT_BATCH_SIZE = 5000
+    # Cache of rendered discovery lists of archived planets ("lru", "redis" or "null")
+    FRAGMENT_CACHE_BACKEND = os.environ.get("FRAGMENT_CACHE_BACKEND", "lru")
+    FRAGMENT_CACHE_SIZE = 1024
+    FRAGMENT_CACHE_TTL = 3600
+    FRAGMENT_CACHE_REDIS_URL = os.environ.get(
+        "FRAGMENT_CACHE_REDIS_URL", "redis://localhost:6379/0"
+    )
+    # Cache of user identities, so that views which don't need the whole user skip loading it ("lru", "redis" or "null")
+    # With "lru" each worker has its own cache, and the latest version of users is shared by the workers of a host
+    # in a memory-mapped file, so that every worker notices a password reset on its next request
+    USER_CACHE_BACKEND = os.environ.get("USER_CACHE_BACKEND", "lru")
+    USER_CACHE_SIZE = 4096
+    USER_CACHE_TTL = 60
+    USER_CACHE_SHARED_PATH = os.environ.get(
+        "USER_CACHE_SHARED_PATH",
+        os.path.join(SHARED_MEMORY_FOLDER, "captains_log_user_versions"),
+    )
+    USER_CACHE_SHARED_SLOTS = 65536
+    # Sessions created before they held the user's version are accepted as version 1 until this ISO 8601 date (UTC)
+    # When it isn't set, they are logged out
+    UNVERSIONED_SESSIONS_UNTIL = (
+        datetime.fromisoformat(os.environ["UNVERSIONED_SESSIONS_UNTIL"])
+        if os.environ.get("UNVERSIONED_SESSIONS_UNTIL")
+        else None
+    )
+    USER_CACHE_REDIS_URL = os.environ.get(
+        "USER_CACHE_REDIS_URL", "redis://localhost:6379/0"
+    )
+    # Number of proxies in front of the app whose X-Forwarded-For header is trusted for the client's IP address
+    TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", 0))
+    # Rate limits of login and password reset attempts, as (requests, seconds), per client IP address and per email
+    RATELIMIT_LOGIN_PER_IP = (30, 60)
+    RATELIMIT_LOGIN_PER_EMAIL = (10, 60)
+    RATELIMIT_RESET_PER_IP = (10, 3600)
+    RATELIMIT_RESET_PER_EMAIL = (3, 3600)
+    # Storage of the rate limits ("memory", "shared", "redis" or "null")
+    # "memory" limits each worker separately, "shared" uses a memory-mapped file shared by the workers of a host
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE", "memory")
+    RATELIMIT_MEMORY_SIZE = 10000
+    RATELIMIT_SHARED_PATH = os.environ.get(
+        "RATELIMIT_SHARED_PATH",
+        os.path.join(SHARED_MEMORY_FOLDER, "captains_log_ratelimit"),
+    )
+    RATELIMIT_SHARED_SLOTS = 65536
+    RATELIMIT_REDIS_URL = os.environ.get(
+        "RATELIMIT_REDIS_URL", "redis://localhost:6379/0"
+    )
+    # Compress responses of these mimetypes with brotli (when installed) or gzip
+    COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") == "1"
+    COMPRESSION_MIMETYPES = (
+        "text/html",
+        "text/css",
+        "text/plain",
+        "text/markdown",
+        "application/javascript",
+        "application/json",
+        "application/x-ndjson",
+    )
+    # Responses smaller than this many bytes aren't worth compressing
+    COMPRESSION_MIN_SIZE = 1024
+    # Flush streamed responses after this many bytes, so that clients receive them as they're generated
+    COMPRESSION_STREAM_FLUSH_SIZE = 4096
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+    # Stream the planet and archive pages while they're rendered, instead of rendering them first
+    STREAM_TEMPLATES = os.environ.get("STREAM_TEMPLATES") == "1"
+    # Number of characters rendered before a chunk of a streamed page is sent
+    STREAM_BUFFER_SIZE = 4096
+    # Add the number of SQL statements executed to every response (always on in debug mode)
+    QUERY_COUNT_HEADER = os.environ.get("QUERY_COUNT_HEADER") == "1"
+    # Time SQL, templates, hashing and email per request (Server-Timing header, JSON logs, /internal/metrics)
+    INSTRUMENTATION = os.environ.get("INSTRUMENTATION") == "1"
+    # Bearer token required to read /internal/metrics, which isn't served without it outside debug and testing
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    # Report relationships lazy loaded more than LAZY_LOAD_THRESHOLD times per request ("warn", "raise" or None)
+    LAZY_LOAD_DETECTION = None
+    LAZY_LOAD_THRESHOLD = 3
+
+
+class DevelopmentConfig(Config):
+    """Class to handle app configuration for local development"""
+
+    DEBUG = True
+    SECRET_KEY = os.environ.get("SECRET_KEY", "development")
+    # Relative to the app package, unless DATABASE_URL is set
+    DEFAULT_DATABASE_URI = "sqlite:///site.db"
+    MAIL_TRANSPORT = os.environ.get("MAIL_TRANSPORT", "console")
+    LAZY_LOAD_DETECTION = "warn"
+
+
+class TestingConfig(Config):
+    """Class to handle app configuration for tests and benchmarks"""
+
+    TESTING = True
+    SECRET_KEY = "testing"
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    HASHING_EXECUTOR = "inline"
+    MAIL_QUEUE_BACKEND = "sync"
+    LAZY_LOAD_DETECTION = "raise"
+    # User versions are kept in the process rather than shared between apps created by tests and benchmarks
+    USER_CACHE_SHARED_PATH = None
+
+
+class ProductionConfig(Config):
+    """Class to handle app configuration in production"""
+
+    # The Procfile deploys behind the Heroku router, which appends the client's address to X-Forwarded-For
+    # Without it, every client would share the router's address and its rate limits
+    TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", 1))
+
+
+# Configuration profiles that can be selected with the CAPTAINS_LOG_CONFIG environment variable
+profiles = {
+    "development": DevelopmentConfig,
+    "testing": TestingConfig,
+    "production": ProductionConfig,
+}
+
+
+def resolve_database(app):
+    """Function that sets the database URI and engine options of an app that was configured from a profile"""
+
+    uri = (
+        app.config["SQLALCHEMY_DATABASE_URI"]
+        or os.environ.get("DATABASE_URL")
+        or app.config.get("DEFAULT_DATABASE_URI")
+    )
+    if uri is None:
+        raise RuntimeError("The DATABASE_URL environment variable is not set.")
+    # Heroku still provides URIs with the scheme SQLAlchemy dropped
+    if uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(uri))
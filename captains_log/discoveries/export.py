@@ -0,0 +1,89 @@
+from captains_log import db
+from captains_log.models import Discovery, Planet
+from flask import current_app
+import json
+
+
+def logbook_rows(user_id):
+    """Function that streams the planets of a user joined with their logged discoveries.
+    Rows are fetched in batches of EXPORT_BATCH_SIZE with a server-side cursor where supported."""
+
+    return (
+        db.session.query(
+            Planet.id,
+            Planet.name,
+            Planet.things_to_discover,
+            Planet.status,
+            Planet.archived_at,
+            Discovery.number,
+            Discovery.circumstances,
+            Discovery.thing_discovered,
+            Discovery.description,
+        )
+        .outerjoin(
+            Discovery,
+            db.and_(Discovery.planet_id == Planet.id, Discovery.description != None),
+        )
+        .filter(Planet.user_id == user_id)
+        .order_by(Planet.id, Discovery.number)
+        .yield_per(current_app.config["EXPORT_BATCH_SIZE"])
+    )
+
+
+def logbook_planets(user_id):
+    """Generator that yields one dict per planet of a user, with its logged discoveries.
+    Only a single planet is held in memory at a time."""
+
+    planet = None
+    for row in logbook_rows(user_id):
+        if planet is None or planet["id"] != row.id:
+            if planet is not None:
+                yield planet
+            planet = {
+                "id": row.id,
+                "name": row.name,
+                "things_to_discover": row.things_to_discover,
+                "status": row.status,
+                "archived_at": row.archived_at.isoformat() if row.archived_at else None,
+                "discoveries": [],
+            }
+        # Planets without logged discoveries have a single row without a discovery
+        if row.number is not None:
+            planet["discoveries"].append(
+                {
+                    "number": row.number,
+                    "circumstances": row.circumstances,
+                    "thing_discovered": row.thing_discovered,
+                    "description": row.description,
+                }
+            )
+    if planet is not None:
+        yield planet
+
+
+def export_ndjson(user_id):
+    """Generator that yields a user's logbook as JSON Lines, one planet per line"""
+
+    for planet in logbook_planets(user_id):
+        yield json.dumps(planet) + "\n"
+
+
+def export_markdown(user_id):
+    """Generator that yields a user's logbook as a Markdown document"""
+
+    yield "# Captain's Log\n"
+    for planet in logbook_planets(user_id):
+        yield f"\n## {planet['name']}\n"
+        for discovery in planet["discoveries"]:
+            yield (
+                f"\n### Discovery {discovery['number']}\n\n"
+                f"*{discovery['circumstances']}: {discovery['thing_discovered']}.*\n\n"
+                f"{discovery['description']}\n"
+            )
+
+
+# Export formats with their generator, mimetype and file extension
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson", "ndjson"),
+    "markdown": (export_markdown, "text/markdown", "md"),
+}
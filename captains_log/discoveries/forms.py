@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired
 from wtforms import (
     StringField,
     SubmitField,
@@ -26,3 +27,10 @@ class PlanetNameForm(FlaskForm):
         render_kw={"autofocus": True, "onFocus": "this.select()"},
     )
     submit = SubmitField("Name Planet")
+
+
+class ImportForm(FlaskForm):
+    """WTForm class to import a logbook exported as JSON Lines"""
+
+    logbook = FileField("Logbook file (.ndjson):", validators=[FileRequired()])
+    submit = SubmitField("Import")
@@ -0,0 +1,169 @@
+from captains_log import db
+from captains_log.models import Discovery, Planet, User
+from datetime import datetime
+import json
+import time
+
+
+class LogbookError(ValueError):
+    """Exception raised when a logbook being imported contains an invalid record"""
+
+    def __init__(self, line_number, message):
+        super().__init__(f"Line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def validate_string(record, key, max_length, line_number):
+    """Function that returns a required, non-empty string field of a record"""
+
+    value = record.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise LogbookError(line_number, f"{key} must be a non-empty string.")
+    if max_length is not None and len(value) > max_length:
+        raise LogbookError(
+            line_number, f"{key} is longer than {max_length} characters."
+        )
+    return value
+
+
+def parse_logbook(lines):
+    """Generator that parses and validates a logbook exported as JSON Lines, one planet per line.
+    Yields (planet, discoveries) tuples of column values. Discoveries are numbered from 1 in their
+    exported order, and the number of things to discover covers every discovery."""
+
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as error:
+            raise LogbookError(line_number, f"invalid JSON ({error.msg}).")
+        if not isinstance(record, dict):
+            raise LogbookError(line_number, "each line must be a JSON object.")
+
+        records = record.get("discoveries", [])
+        if not isinstance(records, list) or not all(
+            isinstance(discovery, dict) for discovery in records
+        ):
+            raise LogbookError(line_number, "discoveries must be a list of objects.")
+        # Keep the exported order of discoveries that have a number
+        records = sorted(
+            records,
+            key=lambda discovery: discovery.get("number")
+            if isinstance(discovery.get("number"), int)
+            else 0,
+        )
+        discoveries = [
+            {
+                "number": number,
+                "circumstances": validate_string(
+                    discovery, "circumstances", 40, line_number
+                ),
+                "thing_discovered": validate_string(
+                    discovery, "thing_discovered", 70, line_number
+                ),
+                "description": validate_string(
+                    discovery, "description", None, line_number
+                ),
+            }
+            for number, discovery in enumerate(records, start=1)
+        ]
+
+        things_to_discover = record.get("things_to_discover", len(discoveries))
+        if not isinstance(things_to_discover, int) or things_to_discover < 0:
+            raise LogbookError(
+                line_number, "things_to_discover must be a non-negative integer."
+            )
+        # Planets archived before archive times were recorded are exported without one
+        archived_at = record.get("archived_at")
+        if archived_at is not None:
+            try:
+                archived_at = datetime.fromisoformat(archived_at)
+            except (TypeError, ValueError):
+                raise LogbookError(
+                    line_number, "archived_at must be an ISO 8601 date or null."
+                )
+
+        planet = {
+            "name": validate_string(record, "name", 80, line_number),
+            "things_to_discover": max(things_to_discover, len(discoveries), 1),
+            "status": Planet.ARCHIVED,
+            "archived_at": archived_at,
+        }
+        yield planet, discoveries
+
+
+class ImportStats:
+    """Class that counts the rows written by an import and its throughput"""
+
+    def __init__(self):
+        self.planets = 0
+        self.discoveries = 0
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        return self.planets + self.discoveries
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"Imported {self.planets} planet(s) and {self.discoveries} discovery(ies) "
+            f"in {self.seconds:.2f} s ({self.rows_per_second:.0f} rows/sec)."
+        )
+
+
+def import_batch(user_id, batch, stats):
+    """Function that writes a batch of parsed planets and their discoveries in one transaction"""
+
+    # Lock the user row so that no other planet of the user is created during the batch
+    db.session.query(User.id).filter_by(id=user_id).with_for_update().one()
+    planets = [dict(planet, user_id=user_id) for planet, _ in batch]
+    db.session.execute(Planet.__table__.insert(), planets)
+    # Ids of the user's newest planets are the ids of the batch, in insertion order
+    planet_ids = [
+        planet_id
+        for (planet_id,) in db.session.query(Planet.id)
+        .filter_by(user_id=user_id)
+        .order_by(Planet.id.desc())
+        .limit(len(planets))
+    ][::-1]
+    discoveries = [
+        dict(discovery, planet_id=planet_id)
+        for planet_id, (_, planet_discoveries) in zip(planet_ids, batch)
+        for discovery in planet_discoveries
+    ]
+    if discoveries:
+        db.session.execute(Discovery.__table__.insert(), discoveries)
+    db.session.commit()
+    stats.planets += len(planets)
+    stats.discoveries += len(discoveries)
+
+
+def import_logbook(user_id, lines, batch_size):
+    """Function that imports a logbook exported as JSON Lines for a user.
+    Records are validated while streaming and written in transactions of about batch_size rows.
+    Batches written before an invalid record are kept. Returns the import's statistics."""
+
+    stats = ImportStats()
+    batch = []
+    rows = 0
+    try:
+        for planet, discoveries in parse_logbook(lines):
+            batch.append((planet, discoveries))
+            rows += 1 + len(discoveries)
+            if rows >= batch_size:
+                import_batch(user_id, batch, stats)
+                batch = []
+                rows = 0
+        if batch:
+            import_batch(user_id, batch, stats)
+    finally:
+        stats.seconds = time.perf_counter() - stats.start
+    return stats
@@ -1,18 +1,56 @@
 from captains_log import db
+from captains_log.asyncdb import async_db, async_version
+from captains_log.discoveries.export import EXPORT_FORMATS
 from captains_log.discoveries.forms import (
     DiscoveryForm,
+    ImportForm,
     PlanetNameForm,
 )
+from captains_log.discoveries.importer import import_logbook, LogbookError
+from captains_log.discoveries.search import (
+    decode_cursor,
+    encode_cursor,
+    search_discoveries,
+)
+from captains_log.discoveries.utils import (
+    advance_exploration,
+    archive_page,
+    archive_page_arguments,
+    archive_page_async,
+    DeferredMarkup,
+    ExplorationConflict,
+    has_archived_planets_query,
+    invalidate_discoveries,
+    render_discoveries,
+    render_discoveries_async,
+    render_page,
+    start_exploration,
+)
 from captains_log.models import Planet, Discovery
-from flask import abort, Blueprint, flash, redirect, render_template, request, url_for
+from captains_log.prompts import PromptsExhausted
+from captains_log.users.utils import exploration_state
+from flask import (
+    abort,
+    Blueprint,
+    current_app,
+    flash,
+    redirect,
+    render_template,
+    request,
+    Response,
+    stream_with_context,
+    url_for,
+)
 from flask_login import current_user, login_required
 from random import randint
+from sqlalchemy.orm import joinedload
 
 # Initialize Blueprint
 discoveries = Blueprint("discoveries", __name__)
 
 
 @discoveries.route("/explore", methods=["GET", "POST"])
+@exploration_state
 @login_required
 def explore():
     """View to present the user with a random planet to explore"""
@@ -40,27 +78,18 @@ def explore():
 
     # If a form was submitted, get the number of things to discover
     if request.method == "POST":
-        things_to_discover = request.form["things_to_discover"]
-        # Create a new planet
-        planet = Planet(things_to_discover=things_to_discover, user_id=current_user.id)
-        db.session.add(planet)
-        db.session.commit()
-        # Generate random priompt
-        circumstances, thing_discovered = planet.generate_prompt()
-        # Create the first discovery in the planet
-        discovery = Discovery(
-            number=1,
-            circumstances=circumstances,
-            thing_discovered=thing_discovered,
-            description=None,
-            planet_id=planet.id,
-        )
-        db.session.add(discovery)
-        db.session.commit()
-        # Update user's current planet and discovery
-        current_user.current_planet_id = planet.id
-        current_user.current_discovery_id = discovery.id
-        db.session.commit()
+        things_to_discover = request.form.get("things_to_discover", type=int)
+        if things_to_discover is None or not 1 <= things_to_discover <= 6:
+            flash("There can be 1 to 6 things to discover on a planet.", "danger")
+            return redirect(url_for("discoveries.explore"))
+        # Create a new planet with its first discovery in a single transaction
+        try:
+            planet = start_exploration(current_user, things_to_discover)
+        except ExplorationConflict:
+            return redirect(url_for("discoveries.explore"))
+        except PromptsExhausted as error:
+            flash(str(error), "danger")
+            return redirect(url_for("discoveries.explore"))
         # Redirect to first discovery
         return redirect(
             url_for("discoveries.discovery", planet_id=planet.id, discovery_number=1)
@@ -73,6 +102,7 @@ def explore():
 @discoveries.route(
     "/explore/<int:planet_id>/<int:discovery_number>", methods=["GET", "POST"]
 )
+@exploration_state
 @login_required
 def discovery(planet_id, discovery_number):
     """View to log discoveries in current planet being explored"""
@@ -93,28 +123,19 @@ def discovery(planet_id, discovery_number):
     form = DiscoveryForm()
     # If form validated, update discovery in db
     if form.validate_on_submit():
-        current_discovery.description = form.description.data
-        db.session.commit()
-        # If the updated discovery was the last one in this planet, redirect to naming of planet
-        if current_discovery.number == current_planet.things_to_discover:
-            return redirect(
-                url_for("discoveries.name_planet", planet_id=current_planet.id)
+        # Log discovery and create the next one in a single transaction
+        try:
+            discovery = advance_exploration(
+                current_user, discovery_number, form.description.data
             )
-        # Generate random prompt
-        circumstances, thing_discovered = current_planet.generate_prompt()
-        # After updating current discovery, create the next one
-        discovery = Discovery(
-            number=current_discovery.number + 1,
-            circumstances=circumstances,
-            thing_discovered=thing_discovered,
-            description=None,
-            planet_id=current_planet.id,
-        )
-        db.session.add(discovery)
-        db.session.commit()
-        # Update user's current discovery
-        current_user.current_discovery_id = discovery.id
-        db.session.commit()
+        except ExplorationConflict:
+            abort(404)
+        except PromptsExhausted as error:
+            flash(str(error), "danger")
+            return redirect(url_for("discoveries.explore"))
+        # If the logged discovery was the last one in this planet, redirect to naming of planet
+        if discovery is None:
+            return redirect(url_for("discoveries.name_planet", planet_id=planet_id))
         # Redirect to next discovery
         return redirect(
             url_for(
@@ -135,6 +156,7 @@ def discovery(planet_id, discovery_number):
 
 
 @discoveries.route("/explore/<int:planet_id>/name", methods=["GET", "POST"])
+@exploration_state
 @login_required
 def name_planet(planet_id):
     """View to name planet after discovering everything on it"""
@@ -152,6 +174,7 @@ def name_planet(planet_id):
     if form.validate_on_submit():
         planet_id = current_planet.id
         current_planet.name = form.name.data
+        current_planet.archive()
         # Reset current planet and current discovery
         current_user.current_planet_id = None
         current_user.current_discovery_id = None
@@ -170,21 +193,134 @@ def name_planet(planet_id):
 @discoveries.route("/archive")
 @login_required
 def archive():
-    """View to render archive page in order to present list of archived planets"""
-
-    # Query db for all the planets associated with current user
-    planets = (
-        db.session.query(Planet)
-        .join(Discovery)
-        .filter(
-            Planet.user_id == current_user.id,
-            Discovery.number == 1,
-            Discovery.description != None,
-        )
+    """View to render archive page in order to present list of archived planets.
+    The list is paginated by planet id: ?before=<planet_id>&limit=N returns the N planets preceding before."""
+
+    before, limit = archive_page_arguments()
+
+    # Query db for the planets associated with current user, newest first
+    planets, next_before = archive_page(current_user.id, before, limit)
+
+    # An empty first page means there are no planets at all, otherwise check for existence
+    if planets or before is None:
+        has_planets = bool(planets)
+    else:
+        has_planets = db.session.execute(
+            has_archived_planets_query(current_user.id)
+        ).scalar()
+
+    # Pass planets to template
+    return render_page(
+        "archive.html",
+        planets=planets,
+        has_planets=has_planets,
+        before=before,
+        next_before=next_before,
+        limit=limit,
     )
 
+
+@async_version(discoveries, "archive")
+@login_required
+async def archive_async():
+    """View to render archive page, querying the db with the asyncio engine"""
+
+    before, limit = archive_page_arguments()
+
+    async with async_db.session() as session:
+        # Query db for the planets associated with current user, newest first
+        planets, next_before = await archive_page_async(
+            session, current_user.id, before, limit
+        )
+        # An empty first page means there are no planets at all, otherwise check for existence
+        if planets or before is None:
+            has_planets = bool(planets)
+        else:
+            has_planets = await session.scalar(
+                has_archived_planets_query(current_user.id)
+            )
+
     # Pass planets to template
-    return render_template("archive.html", planets=planets)
+    return render_page(
+        "archive.html",
+        planets=planets,
+        has_planets=has_planets,
+        before=before,
+        next_before=next_before,
+        limit=limit,
+    )
+
+
+@discoveries.route("/archive/search")
+@login_required
+def search():
+    """View to search the descriptions of the current user's discoveries.
+    Results are ranked and paginated with a cursor: ?q=<query>&after=<cursor>"""
+
+    query = request.args.get("q", "").strip()
+    after = decode_cursor(request.args.get("after"))
+    limit = current_app.config["SEARCH_PAGE_SIZE"]
+
+    # Fetch one extra result to know whether there is a next page
+    results = (
+        search_discoveries(current_user.id, query, limit + 1, after) if query else []
+    )
+    next_after = encode_cursor(results[limit - 1]) if len(results) > limit else None
+    results = results[:limit]
+
+    return render_template(
+        "search.html",
+        query=query,
+        results=results,
+        after=after,
+        next_after=next_after,
+    )
+
+
+@discoveries.route("/archive/export")
+@login_required
+def export():
+    """View to download the current user's logbook.
+    The format is passed as ?format=ndjson (default) or ?format=markdown, and the file is streamed."""
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+    generate, mimetype, extension = EXPORT_FORMATS[export_format]
+
+    return Response(
+        stream_with_context(generate(current_user.id)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=captains_log.{extension}"
+        },
+    )
+
+
+@discoveries.route("/archive/import", methods=["GET", "POST"])
+@login_required
+def import_planets():
+    """View to import a logbook exported as JSON Lines into the current user's archive"""
+
+    # Create WTForm to upload the logbook
+    form = ImportForm()
+    # If form validated, stream the uploaded file into the db
+    if form.validate_on_submit():
+        try:
+            stats = import_logbook(
+                current_user.id,
+                form.logbook.data.stream,
+                current_app.config["IMPORT_BATCH_SIZE"],
+            )
+        except (LogbookError, UnicodeDecodeError) as error:
+            db.session.rollback()
+            flash(f"Import stopped. {error}", "danger")
+        else:
+            flash(str(stats), "success")
+            return redirect(url_for("discoveries.archive"))
+
+    # Render page with import form
+    return render_template("import.html", form=form)
 
 
 @discoveries.route("/archive/<int:planet_id>")
@@ -194,11 +330,41 @@ def planet(planet_id):
 
     # Validate that the planet exists and that the current user is authorized to view it
     planet = Planet.query.get_or_404(planet_id)
-    if planet.explorer != current_user:
+    if planet.user_id != current_user.id:
         abort(403)
 
-    return render_template(
-        "planet.html", planet=planet, current_planet_id=current_user.current_planet_id
+    # Logged discoveries are only loaded if the rendered list isn't cached
+    # When streaming, they're loaded once the page before them was sent
+    if current_app.config["STREAM_TEMPLATES"]:
+        discoveries = DeferredMarkup(render_discoveries, planet)
+    else:
+        discoveries = render_discoveries(planet)
+    return render_page(
+        "planet.html",
+        planet=planet,
+        discoveries=discoveries,
+    )
+
+
+@async_version(discoveries, "planet")
+@login_required
+async def planet_async(planet_id):
+    """View to list the discoveries of a planet, querying the db with the asyncio engine"""
+
+    async with async_db.session() as session:
+        # Validate that the planet exists and that the current user is authorized to view it
+        planet = await session.get(Planet, planet_id)
+        if planet is None:
+            abort(404)
+        if planet.user_id != current_user.id:
+            abort(403)
+
+        # Logged discoveries are only loaded if the rendered list isn't cached
+        discoveries = await render_discoveries_async(session, planet)
+    return render_page(
+        "planet.html",
+        planet=planet,
+        discoveries=discoveries,
     )
 
 
@@ -210,7 +376,7 @@ def rename_planet(planet_id):
     # Query db for planet by id
     planet = Planet.query.get_or_404(planet_id)
     # Make sure planet is associated with current user
-    if planet.explorer != current_user:
+    if planet.user_id != current_user.id:
         abort(403)
 
     # Create WTForm to edit planet name
@@ -218,7 +384,9 @@ def rename_planet(planet_id):
     form.submit.label.text = "Rename"
     # If form validated, update planet name in db
     if form.validate_on_submit():
+        invalidate_discoveries(planet)
         planet.name = form.name.data
+        planet.bump_version()
         db.session.commit()
         flash("Planet renamed successfully", "success")
         # Redirect to planet page in archive
@@ -240,10 +408,11 @@ def delete_planet(planet_id):
     # Query db for planet by id
     planet = Planet.query.get_or_404(planet_id)
     # Make sure planet is associated with current user
-    if planet.explorer != current_user:
+    if planet.user_id != current_user.id:
         abort(403)
 
     # Delete planet from db
+    invalidate_discoveries(planet)
     db.session.delete(planet)
     db.session.commit()
     flash("Planet deleted successfully", "success")
@@ -258,15 +427,17 @@ def delete_planet(planet_id):
 def edit_discovery(planet_id, discovery_number):
     """View to edit archived discoveries. Planet id and discovery number are passed as route variables."""
 
-    # Query db for discovery by planet id and discovery number
-    discovery = Discovery.query.filter_by(
-        planet_id=planet_id, number=discovery_number
-    ).first()
+    # Query db for discovery by planet id and discovery number, along with its planet
+    discovery = (
+        Discovery.query.options(joinedload(Discovery.planet))
+        .filter_by(planet_id=planet_id, number=discovery_number)
+        .first()
+    )
     if discovery is None:
         abort(404)
 
     # Make sure discovery is associated with current user
-    if discovery.planet.explorer != current_user:
+    if discovery.planet.user_id != current_user.id:
         abort(403)
 
     # Create WTForm to edit discovery
@@ -274,7 +445,9 @@ def edit_discovery(planet_id, discovery_number):
     form.submit.label.text = "Update"
     # If form validated, update discovery in db
     if form.validate_on_submit():
+        invalidate_discoveries(discovery.planet)
         discovery.description = form.description.data
+        discovery.planet.bump_version()
         db.session.commit()
         flash("Your discovery has been updated.", "success")
         # Redirect to planet page in archive
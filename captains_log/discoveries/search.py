@@ -0,0 +1,168 @@
+from captains_log import db
+from captains_log.models import Discovery
+from markupsafe import escape, Markup
+import re
+from sqlalchemy import event
+
+# Markers placed around matches by the database, replaced with <mark> tags once the snippet is escaped
+START = "\x02"
+STOP = "\x03"
+
+# SQLite FTS5 index of discovery descriptions, kept in sync by triggers.
+# Each row carries an owner token (u<user id>) so that matches are intersected with the user's discoveries.
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS discovery_fts USING fts5(description, owner)",
+    "CREATE TRIGGER IF NOT EXISTS discovery_fts_insert AFTER INSERT ON discovery BEGIN "
+    "INSERT INTO discovery_fts(rowid, description, owner) "
+    "SELECT new.id, new.description, 'u' || user_id FROM planet WHERE id = new.planet_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS discovery_fts_delete AFTER DELETE ON discovery BEGIN "
+    "DELETE FROM discovery_fts WHERE rowid = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS discovery_fts_update AFTER UPDATE OF description ON discovery BEGIN "
+    "UPDATE discovery_fts SET description = new.description WHERE rowid = new.id; "
+    "END",
+)
+SQLITE_SETUP = (
+    # Rank by description only, the owner column is just a filter
+    "INSERT INTO discovery_fts(discovery_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+    # Index descriptions that were written before the index existed
+    "INSERT INTO discovery_fts(rowid, description, owner) "
+    "SELECT d.id, d.description, 'u' || p.user_id FROM discovery d JOIN planet p ON p.id = d.planet_id",
+)
+
+# Postgres GIN index over the same expression the search query uses, so it never goes stale
+POSTGRES_VECTOR = "to_tsvector('english', coalesce(d.description, ''))"
+POSTGRES_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_discovery_description_fts ON discovery "
+    "USING gin (to_tsvector('english', coalesce(description, '')))",
+)
+
+# Lower bm25 scores are better matches in SQLite, higher ts_rank scores in Postgres
+SQLITE_QUERY = """
+    SELECT d.id, d.planet_id, d.number, p.name AS planet_name,
+        snippet(discovery_fts, 0, :start, :stop, '…', 24) AS snippet,
+        discovery_fts.rank AS rank
+    FROM discovery_fts
+    JOIN discovery d ON d.id = discovery_fts.rowid
+    JOIN planet p ON p.id = d.planet_id
+    WHERE discovery_fts MATCH :query AND p.user_id = :user_id
+        AND (:rank IS NULL OR discovery_fts.rank > :rank
+            OR (discovery_fts.rank = :rank AND d.id > :id))
+    ORDER BY discovery_fts.rank, d.id
+    LIMIT :limit
+"""
+POSTGRES_QUERY = f"""
+    SELECT s.id, s.planet_id, s.number, s.planet_name,
+        ts_headline('english', s.description, s.query, :options) AS snippet,
+        s.rank
+    FROM (
+        SELECT d.id, d.planet_id, d.number, p.name AS planet_name, d.description, q.query,
+            CAST(ts_rank({POSTGRES_VECTOR}, q.query) AS float8) AS rank
+        FROM discovery d
+        JOIN planet p ON p.id = d.planet_id
+        CROSS JOIN websearch_to_tsquery('english', :query) AS q(query)
+        WHERE p.user_id = :user_id AND {POSTGRES_VECTOR} @@ q.query
+    ) s
+    WHERE CAST(:rank AS float8) IS NULL OR s.rank < :rank
+        OR (s.rank = :rank AND s.id > :id)
+    ORDER BY s.rank DESC, s.id
+    LIMIT :limit
+"""
+
+
+def create_search_index(connection):
+    """Function that creates the full-text index of discovery descriptions if it doesn't exist"""
+
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        exists = connection.execute(
+            db.text("SELECT 1 FROM sqlite_master WHERE name = 'discovery_fts'")
+        ).first()
+        for statement in SQLITE_DDL:
+            connection.execute(db.text(statement))
+        if not exists:
+            for statement in SQLITE_SETUP:
+                connection.execute(db.text(statement))
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.execute(db.text(statement))
+
+
+@event.listens_for(Discovery.__table__, "after_create")
+def discovery_created(target, connection, **kwargs):
+    """Event listener that creates the full-text index along with the discovery table"""
+
+    create_search_index(connection)
+
+
+def sqlite_match_query(user_id, query):
+    """Function that turns free text into an FTS5 query matching every word in the user's discoveries.
+    Words are quoted so that FTS5 operators in user input are matched literally."""
+
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return f'owner:"u{user_id}" ' + " ".join(f'description:"{word}"' for word in words)
+
+
+def highlight(snippet):
+    """Function that escapes a snippet and wraps the matches in <mark> tags"""
+
+    return Markup(
+        str(escape(snippet)).replace(START, "<mark>").replace(STOP, "</mark>")
+    )
+
+
+def search_discoveries(user_id, query, limit, after=None):
+    """Function that searches the logged discoveries of a user, best matches first.
+    after is the (rank, id) of the last result of the previous page.
+    Returns a list of result rows with a highlighted snippet."""
+
+    rank, discovery_id = after if after is not None else (None, None)
+    params = {
+        "query": query,
+        "user_id": user_id,
+        "rank": rank,
+        "id": discovery_id,
+        "limit": limit,
+    }
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        params.update(query=sqlite_match_query(user_id, query), start=START, stop=STOP)
+        if not params["query"]:
+            return []
+        statement = SQLITE_QUERY
+    elif dialect == "postgresql":
+        params["options"] = f"StartSel={START}, StopSel={STOP}, MaxWords=24, MinWords=8"
+        statement = POSTGRES_QUERY
+    else:
+        raise RuntimeError(f"Full-text search is not supported on {dialect}.")
+
+    return [
+        {
+            "id": row.id,
+            "planet_id": row.planet_id,
+            "number": row.number,
+            "planet_name": row.planet_name,
+            "snippet": highlight(row.snippet),
+            "rank": row.rank,
+        }
+        for row in db.session.execute(db.text(statement), params)
+    ]
+
+
+def encode_cursor(result):
+    """Function that encodes the position of a search result for keyset pagination"""
+
+    return f"{result['rank']!r}:{result['id']}"
+
+
+def decode_cursor(cursor):
+    """Function that decodes a search cursor, returning None if it is missing or invalid"""
+
+    try:
+        rank, discovery_id = cursor.split(":")
+        return float(rank), int(discovery_id)
+    except (AttributeError, ValueError):
+        return None
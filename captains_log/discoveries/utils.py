@@ -0,0 +1,333 @@
+from captains_log import db, fragment_cache
+from captains_log.models import Discovery, Planet, User
+from captains_log.prompts import draw_prompt, PromptsExhausted
+from flask import (
+    current_app,
+    render_template,
+    request,
+    Response,
+    stream_with_context,
+)
+from markupsafe import Markup
+from sqlalchemy import exists, select
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class ExplorationConflict(Exception):
+    """Exception raised when the user's exploration state changed during a request"""
+
+
+def lock_user(user):
+    """Function that takes a row lock on the user for the rest of the transaction.
+    The user's exploration state is reloaded from the db once the lock is held."""
+
+    return (
+        db.session.query(User)
+        .filter_by(id=user.id)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+
+
+def create_discovery(planet, number, used=None):
+    """Function that adds a new unlogged discovery with a random prompt to a planet.
+    used is the set of things already discovered on the planet, queried if not given.
+    The discovery is flushed but not committed, so that its id is available."""
+
+    if used is None:
+        circumstances, thing_discovered = planet.generate_prompt()
+    else:
+        circumstances, thing_discovered = draw_prompt(used)
+    discovery = Discovery(
+        number=number,
+        circumstances=circumstances,
+        thing_discovered=thing_discovered,
+        description=None,
+        planet_id=planet.id,
+    )
+    db.session.add(discovery)
+    db.session.flush()
+    return discovery
+
+
+def start_exploration(user, things_to_discover, upfront=False):
+    """Function that creates a new planet with its first discovery and sets it as the user's current state.
+    With upfront, every discovery of the planet is created with its prompt, for clients that log them in a batch.
+    Everything is written in a single transaction, which is rolled back if PromptsExhausted is raised.
+    Returns the new planet."""
+
+    user = lock_user(user)
+    if user.current_planet_id is not None:
+        db.session.rollback()
+        raise ExplorationConflict("The user is already exploring a planet.")
+
+    # Create a new planet and flush it to get its id
+    planet = Planet(things_to_discover=things_to_discover, user_id=user.id)
+    db.session.add(planet)
+    db.session.flush()
+    try:
+        # Create the first discovery in the planet
+        discovery = create_discovery(planet, 1)
+        if upfront:
+            used = {discovery.thing_discovered}
+            for number in range(2, planet.things_to_discover + 1):
+                used.add(create_discovery(planet, number, used).thing_discovered)
+    except PromptsExhausted:
+        db.session.rollback()
+        raise
+    # Update user's current planet and discovery
+    user.current_planet_id = planet.id
+    user.current_discovery_id = discovery.id
+    db.session.commit()
+    return planet
+
+
+def advance_exploration(user, discovery_number, description):
+    """Function that logs the user's current discovery and moves on to the next one.
+    Everything is written in a single transaction while holding a row lock on the user,
+    which is rolled back if PromptsExhausted is raised.
+    Returns the next discovery, or None if the logged discovery was the last on the planet."""
+
+    user = lock_user(user)
+    current_planet = user.current_planet
+    current_discovery = user.current_discovery
+    # Make sure a concurrent request didn't already log this discovery
+    if (
+        current_discovery is None
+        or current_discovery.number != discovery_number
+        or current_discovery.description is not None
+    ):
+        db.session.rollback()
+        raise ExplorationConflict("The discovery was already logged.")
+
+    current_discovery.description = description
+    # If the logged discovery was the last one in this planet, there is no next discovery
+    if current_discovery.number == current_planet.things_to_discover:
+        db.session.commit()
+        return None
+
+    # The next discovery already exists if the planet was started with every discovery upfront
+    discoveries = Discovery.query.filter_by(planet_id=current_planet.id).all()
+    number = current_discovery.number + 1
+    discovery = next(
+        (existing for existing in discoveries if existing.number == number), None
+    )
+    if discovery is None:
+        used = {existing.thing_discovered for existing in discoveries}
+        try:
+            discovery = create_discovery(current_planet, number, used)
+        except PromptsExhausted:
+            db.session.rollback()
+            raise
+    # Update user's current discovery
+    user.current_discovery_id = discovery.id
+    db.session.commit()
+    return discovery
+
+
+def log_discoveries(user, planet_id, descriptions, name=None):
+    """Function that logs several discoveries of the user's current planet at once, starting with the current one.
+    The discoveries must already exist, as they do for planets started with every discovery upfront.
+    If every discovery ends up logged and a name is given, the planet is archived.
+    Everything is written in a single transaction while holding a row lock on the user. Returns the planet."""
+
+    user = lock_user(user)
+    planet = user.current_planet
+    if planet is None or planet.id != planet_id:
+        db.session.rollback()
+        raise ExplorationConflict("This planet isn't being explored.")
+
+    pending = (
+        Discovery.query.filter_by(planet_id=planet.id, description=None)
+        .order_by(Discovery.number)
+        .all()
+    )
+    if len(descriptions) > len(pending):
+        db.session.rollback()
+        raise ExplorationConflict(
+            f"Only {len(pending)} discoveries are ready to be logged on this planet."
+        )
+    # Without descriptions, the request can only archive a planet whose discoveries are all logged
+    if not descriptions and pending:
+        db.session.rollback()
+        raise ExplorationConflict(
+            f"{len(pending)} discoveries are left to log on this planet."
+        )
+    for discovery, description in zip(pending, descriptions):
+        discovery.description = description
+
+    # Move on to the first discovery left to log, or stay on the last one until the planet is named
+    remaining = pending[len(descriptions) :]
+    if remaining:
+        user.current_discovery_id = remaining[0].id
+    elif pending:
+        user.current_discovery_id = pending[-1].id
+    if not remaining and name is not None:
+        planet.name = name
+        planet.archive()
+        user.current_planet_id = None
+        user.current_discovery_id = None
+    db.session.commit()
+    return planet
+
+
+def archive_page_arguments():
+    """Function that returns the before and limit arguments of a request for an archive page"""
+
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", current_app.config["ARCHIVE_PAGE_SIZE"], type=int)
+    return before, max(1, min(limit, current_app.config["ARCHIVE_MAX_PAGE_SIZE"]))
+
+
+def archive_page_query(user_id, before, limit):
+    """Function that returns the statement selecting a page of a user's archived planets, newest first.
+    One extra planet is selected to know whether there is a next page."""
+
+    query = select(Planet).filter_by(user_id=user_id, status=Planet.ARCHIVED)
+    if before is not None:
+        query = query.filter(Planet.id < before)
+    return query.order_by(Planet.id.desc()).limit(limit + 1)
+
+
+def split_page(planets, limit):
+    """Function that returns the planets of a page and the id to pass as before to get the next page,
+    or None if it's the last page"""
+
+    next_before = planets[limit - 1].id if len(planets) > limit else None
+    return planets[:limit], next_before
+
+
+def archive_page(user_id, before=None, limit=20):
+    """Function that returns a page of a user's archived planets, newest first, and the id to pass as before
+    to get the next page, or None if it's the last page. The list is paginated by planet id."""
+
+    query = archive_page_query(user_id, before, limit)
+    return split_page(db.session.execute(query).scalars().all(), limit)
+
+
+async def archive_page_async(session, user_id, before=None, limit=20):
+    """Coroutine that returns a page of a user's archived planets as archive_page does, with an async session"""
+
+    result = await session.execute(archive_page_query(user_id, before, limit))
+    return split_page(result.scalars().all(), limit)
+
+
+def has_archived_planets_query(user_id):
+    """Function that returns the statement checking whether a user has archived planets"""
+
+    return select(
+        exists().where(Planet.user_id == user_id, Planet.status == Planet.ARCHIVED)
+    )
+
+
+def discoveries_cache_key(planet):
+    """Function that returns the cache key of a planet's rendered discovery list.
+    Planet ids aren't reused, and the user id keeps the key from matching another user's planet
+    in dbs created before ids were autoincremented on SQLite."""
+
+    return f"planet:{planet.id}:{planet.user_id}:{planet.version}:discoveries"
+
+
+def logged_discoveries_query(planet):
+    """Function that returns the statement selecting a planet's logged discoveries in order"""
+
+    return (
+        select(Discovery)
+        .filter(Discovery.planet_id == planet.id, Discovery.description != None)
+        .order_by(Discovery.number)
+    )
+
+
+def load_logged_discoveries(planet):
+    """Function that eager loads a planet's logged discoveries in one query, as selectinload would,
+    so that rendering them doesn't lazy load the relationship"""
+
+    discoveries = db.session.execute(logged_discoveries_query(planet)).scalars().all()
+    set_committed_value(planet, "logged_discoveries", discoveries)
+
+
+def render_discoveries(planet):
+    """Function that renders the list of logged discoveries of a planet.
+    The list of an archived planet is cached until the planet's version changes,
+    and the discoveries are only loaded on a cache miss."""
+
+    # Planets that are still being explored change without a version bump
+    if planet.status != Planet.ARCHIVED:
+        load_logged_discoveries(planet)
+        return Markup(render_template("includes/discoveries.html", planet=planet))
+
+    key = discoveries_cache_key(planet)
+    html = fragment_cache.get(key)
+    if html is None:
+        load_logged_discoveries(planet)
+        html = render_template("includes/discoveries.html", planet=planet)
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+
+async def render_discoveries_async(session, planet):
+    """Coroutine that renders the list of logged discoveries of a planet as render_discoveries does,
+    with an async session"""
+
+    # Planets that are still being explored change without a version bump
+    archived = planet.status == Planet.ARCHIVED
+    key = discoveries_cache_key(planet)
+    html = fragment_cache.get(key) if archived else None
+    if html is None:
+        result = await session.execute(logged_discoveries_query(planet))
+        set_committed_value(planet, "logged_discoveries", result.scalars().all())
+        html = render_template("includes/discoveries.html", planet=planet)
+        if archived:
+            fragment_cache.set(key, html)
+    return Markup(html)
+
+
+def invalidate_discoveries(planet):
+    """Function that drops a planet's cached discovery list.
+    Must be called before bumping the planet's version or deleting it."""
+
+    fragment_cache.delete(discoveries_cache_key(planet))
+
+
+class DeferredMarkup:
+    """Class of template values that are only rendered when the template outputs them.
+    A streamed page sends everything that comes before the value while it renders."""
+
+    def __init__(self, render, *args):
+        self.render = render
+        self.args = args
+
+    def __html__(self):
+        return self.render(*self.args)
+
+
+def stream_template(template_name, **context):
+    """Generator that renders a template in chunks of at least STREAM_BUFFER_SIZE characters.
+    The request context stays available until the whole page is sent."""
+
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    buffer_size = app.config["STREAM_BUFFER_SIZE"]
+
+    @stream_with_context
+    def generate():
+        chunks, size = [], 0
+        for chunk in app.jinja_env.get_template(template_name).generate(context):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                yield "".join(chunks)
+                chunks, size = [], 0
+        if chunks:
+            yield "".join(chunks)
+
+    return generate()
+
+
+def render_page(template_name, **context):
+    """Function that renders a page, or streams it while it renders if STREAM_TEMPLATES is enabled"""
+
+    if current_app.config["STREAM_TEMPLATES"]:
+        return Response(stream_template(template_name, **context), mimetype="text/html")
+    return render_template(template_name, **context)
@@ -15,6 +15,13 @@ def error_403(error):
     return render_template("errors/403.html"), 403
 
 
+@errors.app_errorhandler(429)
+def error_429(error):
+    """View to render custom HTTP 429 page, telling the client when to retry"""
+    headers = {"Retry-After": error.retry_after} if error.retry_after else {}
+    return render_template("errors/429.html"), 429, headers
+
+
 @errors.app_errorhandler(500)
 def error_500(error):
     """View to render custom HTTP 500 page"""
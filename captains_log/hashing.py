@@ -0,0 +1,97 @@
+import asyncio
+import bcrypt as _bcrypt
+from captains_log import bcrypt
+from captains_log.profiling import timed
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+import multiprocessing
+import os
+from threading import Lock
+
+_executor = None
+_executor_pid = None
+_executor_lock = Lock()
+# Forking a worker whose other threads hold locks would copy them locked into the hashing processes,
+# so the processes are forked from a single-threaded server process instead
+_context = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _hash(password, rounds):
+    """Function run in the hashing processes to hash a password"""
+
+    return _bcrypt.hashpw(password.encode("utf-8"), _bcrypt.gensalt(rounds)).decode(
+        "utf-8"
+    )
+
+
+def _check(hashed, password):
+    """Function run in the hashing processes to check a password against its hash"""
+
+    return _bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def get_executor():
+    """Function that returns the process pool used for hashing, or None to hash inline.
+    The pool is created on first use in each process, so that gunicorn workers don't share it."""
+
+    global _executor, _executor_pid
+    if current_app.config["HASHING_EXECUTOR"] != "process":
+        return None
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config["HASHING_WORKERS"] or os.cpu_count(),
+                mp_context=_context,
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def hash_password(password):
+    """Function that hashes a password at the configured cost"""
+
+    rounds = current_app.config["BCRYPT_LOG_ROUNDS"]
+    executor = get_executor()
+    with timed("bcrypt"):
+        if executor is None:
+            return bcrypt.generate_password_hash(password, rounds).decode("utf-8")
+        return executor.submit(_hash, password, rounds).result()
+
+
+def check_password(hashed, password):
+    """Function that checks a password against its hash"""
+
+    executor = get_executor()
+    with timed("bcrypt"):
+        if executor is None:
+            return bcrypt.check_password_hash(hashed, password)
+        return executor.submit(_check, hashed, password).result()
+
+
+async def hash_password_async(password):
+    """Coroutine that hashes a password at the configured cost without blocking the event loop.
+    The password is hashed in the hashing processes, or in a thread if they're disabled."""
+
+    rounds = current_app.config["BCRYPT_LOG_ROUNDS"]
+    with timed("bcrypt"):
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(), _hash, password, rounds
+        )
+
+
+async def check_password_async(hashed, password):
+    """Coroutine that checks a password against its hash without blocking the event loop"""
+
+    with timed("bcrypt"):
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(), _check, hashed, password
+        )
+
+
+def needs_rehash(hashed):
+    """Function that checks whether a hash was made at a cost other than the configured one"""
+
+    # Hashes are formatted as $<prefix>$<cost>$<salt and hash>
+    return int(hashed.split("$")[2]) != current_app.config["BCRYPT_LOG_ROUNDS"]
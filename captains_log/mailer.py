@@ -0,0 +1,251 @@
+from captains_log import db, mail
+from captains_log.profiling import timed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from queue import Empty, Queue
+import smtplib
+import sys
+from threading import Lock, Thread
+import time
+
+
+class OutgoingEmail(db.Model):
+    """Model that represents emails waiting in the db-backed mail queue"""
+
+    __table_args__ = (
+        # Partial index to find unsent emails that are due
+        db.Index(
+            "ix_outgoing_email_pending",
+            "next_attempt_at",
+            postgresql_where=db.text("sent_at IS NULL"),
+            sqlite_where=db.text("sent_at IS NULL"),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    sender = db.Column(db.String(120))
+    # Comma-separated list of recipients
+    recipients = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text)
+    body = db.Column(db.Text)
+    # Columns that represent the delivery state of the email
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, default=None)
+    last_error = db.Column(db.String(255), default=None)
+
+    @staticmethod
+    def from_message(message):
+        """Static method that creates a queued email from a Flask-Mail message"""
+
+        return OutgoingEmail(
+            subject=message.subject,
+            sender=message.sender,
+            recipients=",".join(message.recipients),
+            html=message.html,
+            body=message.body,
+        )
+
+    def to_message(self):
+        """Method that rebuilds the Flask-Mail message of a queued email"""
+
+        return Message(
+            self.subject,
+            recipients=self.recipients.split(","),
+            html=self.html,
+            body=self.body,
+            sender=self.sender,
+        )
+
+    def __repr__(self):
+        return f"<OutgoingEmail id={self.id}, attempts={self.attempts}, sent_at={self.sent_at}>"
+
+
+class SMTPTransport:
+    """Transport that sends messages through the SMTP server configured for Flask-Mail"""
+
+    @contextmanager
+    def connect(self):
+        with mail.connect() as connection:
+            yield connection
+
+
+class ConsoleTransport:
+    """Transport that writes messages to the standard output, to work offline"""
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def send(self, message):
+        sys.stdout.write(message.as_string() + "\n\n")
+        sys.stdout.flush()
+
+
+class FileTransport:
+    """Transport that appends messages to the file at MAIL_FILE_PATH, to work offline"""
+
+    @contextmanager
+    def connect(self):
+        with open(current_app.config["MAIL_FILE_PATH"], "a") as file:
+            self.file = file
+            yield self
+
+    def send(self, message):
+        self.file.write(message.as_string() + "\n\n")
+
+
+TRANSPORTS = {
+    "smtp": SMTPTransport,
+    "console": ConsoleTransport,
+    "file": FileTransport,
+}
+
+
+def send_batch(messages):
+    """Function that sends messages over a single connection of the configured transport.
+    Returns a list of (message, error) tuples for messages that weren't sent."""
+
+    transport = TRANSPORTS[current_app.config["MAIL_TRANSPORT"]]()
+    failed = []
+    processed = 0
+    try:
+        with timed("mail"), transport.connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(message)
+                except (OSError, smtplib.SMTPException) as error:
+                    failed.append((message, error))
+                processed += 1
+    # If the connection itself failed, none of the remaining messages were sent
+    except (OSError, smtplib.SMTPException) as error:
+        failed.extend((message, error) for message in messages[processed:])
+    return failed
+
+
+def deliver(messages):
+    """Function that sends messages, retrying failed ones with exponential backoff.
+    Returns a list of (message, error) tuples for messages that were never sent."""
+
+    max_retries = current_app.config["MAIL_MAX_RETRIES"]
+    backoff = current_app.config["MAIL_RETRY_BACKOFF"]
+    failed = send_batch(messages)
+    for attempt in range(max_retries):
+        if not failed:
+            break
+        time.sleep(backoff * 2**attempt)
+        failed = send_batch([message for message, _ in failed])
+    for message, error in failed:
+        current_app.logger.error(
+            f"Failed to send email to {message.recipients}: {error}"
+        )
+    return failed
+
+
+def drain_db_queue():
+    """Function that sends one batch of due emails from the db-backed queue.
+    Returns the number of emails processed."""
+
+    now = datetime.utcnow()
+    rows = (
+        OutgoingEmail.query.filter(
+            OutgoingEmail.sent_at == None,
+            OutgoingEmail.attempts <= current_app.config["MAIL_MAX_RETRIES"],
+            OutgoingEmail.next_attempt_at <= now,
+        )
+        .order_by(OutgoingEmail.next_attempt_at)
+        .limit(current_app.config["MAIL_BATCH_SIZE"])
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    messages = [row.to_message() for row in rows]
+    errors = {id(message): error for message, error in send_batch(messages)}
+    backoff = current_app.config["MAIL_RETRY_BACKOFF"]
+    for row, message in zip(rows, messages):
+        error = errors.get(id(message))
+        if error is None:
+            row.sent_at = now
+        else:
+            # Schedule the next attempt with exponential backoff
+            row.last_error = str(error)[:255]
+            row.next_attempt_at = now + timedelta(seconds=backoff * 2**row.attempts)
+            row.attempts += 1
+    db.session.commit()
+    return len(rows)
+
+
+class MailQueue:
+    """Extension that sends emails outside of the request that created them.
+    The backend is chosen by MAIL_QUEUE_BACKEND: "thread" (default) sends from a pool of worker threads,
+    "db" stores emails in a table drained by the 'flask mail-worker' command and "sync" sends inline."""
+
+    def __init__(self, app=None):
+        self._queue = Queue()
+        self._workers = []
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config["MAIL_QUEUE_BACKEND"]
+        if backend not in ("thread", "db", "sync"):
+            raise ValueError(f"Unknown mail queue backend: {backend}")
+        if app.config["MAIL_TRANSPORT"] not in TRANSPORTS:
+            raise ValueError(f"Unknown mail transport: {app.config['MAIL_TRANSPORT']}")
+
+    def enqueue(self, message):
+        """Method that queues a message to be sent.
+        With the db backend, the email is added to the session and sent once the caller commits."""
+
+        backend = current_app.config["MAIL_QUEUE_BACKEND"]
+        if backend == "db":
+            db.session.add(OutgoingEmail.from_message(message))
+        elif backend == "thread":
+            self._start_workers()
+            self._queue.put((current_app._get_current_object(), message))
+        else:
+            deliver([message])
+
+    def _start_workers(self):
+        """Method that starts the worker threads on first use, so that they aren't forked with the process"""
+
+        with self._lock:
+            if self._workers:
+                return
+            for _ in range(current_app.config["MAIL_QUEUE_WORKERS"]):
+                worker = Thread(target=self._work, daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        """Method run by worker threads: takes up to a batch of queued messages and sends them together"""
+
+        while True:
+            app, message = self._queue.get()
+            batch = [message]
+            while len(batch) < app.config["MAIL_BATCH_SIZE"]:
+                try:
+                    batch.append(self._queue.get_nowait()[1])
+                except Empty:
+                    break
+            with app.app_context():
+                try:
+                    deliver(batch)
+                except Exception:
+                    app.logger.exception("Failed to send queued emails")
+            for _ in batch:
+                self._queue.task_done()
+
+    def join(self):
+        """Method that blocks until every message queued to the worker threads was processed"""
+
+        self._queue.join()
+
+
+mail_queue = MailQueue()
@@ -1,3 +1,4 @@
+from captains_log.main.utils import prerendered
 from flask import Blueprint, render_template
 
 # Initialize Blueprint
@@ -5,6 +6,7 @@ main = Blueprint("main", __name__)
 
 
 @main.route("/")
+@prerendered
 def index():
     """View to render index page"""
 
@@ -12,6 +14,7 @@ def index():
 
 
 @main.route("/about")
+@prerendered
 def about():
     """View to render about page"""
 
@@ -19,6 +22,7 @@ def about():
 
 
 @main.route("/music")
+@prerendered
 def music():
     """View to render music page"""
 
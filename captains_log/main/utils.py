@@ -0,0 +1,33 @@
+from flask import current_app, make_response, request, Response, session
+from flask_login import current_user
+from functools import wraps
+import hashlib
+
+
+def prerendered(view):
+    """Decorator for views of pages that are the same for every anonymous visitor.
+    The anonymous page is rendered on its first request and then served from memory with a strong ETag,
+    so that requests with a matching If-None-Match get a 304 without rendering anything.
+    Logged in users, pending flashed messages and debug mode get a freshly rendered page."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_app.debug or "_flashes" in session or current_user.is_authenticated:
+            response = make_response(view(*args, **kwargs))
+        else:
+            pages = current_app.extensions.setdefault("prerendered_pages", {})
+            page = pages.get(request.endpoint)
+            if page is None:
+                html = view(*args, **kwargs)
+                etag = hashlib.sha256(html.encode("utf-8")).hexdigest()
+                page = pages[request.endpoint] = (html, etag)
+            html, etag = page
+            response = Response(html, mimetype="text/html")
+            response.set_etag(etag)
+            # Browsers must revalidate, since logged in users get a different page at the same URL
+            response.cache_control.no_cache = True
+            response = response.make_conditional(request)
+        response.vary.add("Cookie")
+        return response
+
+    return wrapper
@@ -1,20 +1,101 @@
-import captains_log.constants as constants
-from captains_log import bcrypt, db, login_manager, mail
-from flask import current_app, render_template, url_for
+from captains_log import db, login_manager, user_cache
+from captains_log.hashing import (
+    check_password,
+    check_password_async,
+    hash_password,
+    hash_password_async,
+    needs_rehash,
+)
+from captains_log.mailer import mail_queue
+from captains_log.prompts import draw_prompt
+from datetime import datetime
+from flask import current_app, render_template, request, url_for
 from flask_login import UserMixin
 from flask_mail import Message
-from itsdangerous import URLSafeTimedSerializer
-from random import choice
+from itsdangerous import BadData, URLSafeTimedSerializer
+import random
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Method for Flask login manager"""
+    """Method for Flask login manager. user_id is the user's id and version as returned by get_id.
+    Views that don't use the user's exploration state get the user's identity from the user cache
+    without querying the db, as long as the cached version matches the one in the session.
+    Otherwise the user is loaded, and rejected if its version changed since the session was created.
+    In blueprints listed in EAGER_LOAD_BLUEPRINTS, the user's current planet and discovery
+    are loaded in the same query as the user."""
 
-    return User.query.get(int(user_id))
+    user_id, _, version = user_id.partition(":")
+    if version:
+        user_id, version = int(user_id), int(version)
+    # Sessions created before versions were added only hold the id, and every user was at version 1 then
+    elif (
+        current_app.config["UNVERSIONED_SESSIONS_UNTIL"] is not None
+        and datetime.utcnow() < current_app.config["UNVERSIONED_SESSIONS_UNTIL"]
+    ):
+        user_id, version = int(user_id), 1
+    else:
+        return None
+
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, "exploration_state", False):
+        identity = user_cache.get(user_id)
+        if identity is not None and identity["version"] == version:
+            return UserIdentity(**identity)
+
+    query = User.query
+    if request.blueprint in current_app.config["EAGER_LOAD_BLUEPRINTS"]:
+        query = query.options(
+            joinedload(User.current_planet), joinedload(User.current_discovery)
+        )
+    user = query.get(user_id)
+    if user is None:
+        return None
+    user_cache.set(user)
+    if user.version != version:
+        return None
+    return user
+
+
+@login_manager.request_loader
+def load_user_from_request(request):
+    """Method for Flask login manager to authenticate requests with a signed token in the Authorization header.
+    Tokens issued before the user's version changed are rejected.
+    Views marked as read only use the state stored in the token, and only check the user's version.
+    Other views load the user."""
+
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    claims = User.verify_auth_token(authorization[len("Bearer ") :])
+    if claims is None:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, "read_only", False):
+        # The version is checked against the user cache, or the db on a miss, with a single column query
+        identity = user_cache.get(claims["id"])
+        if identity is not None:
+            version = identity["version"]
+        else:
+            version = db.session.query(User.version).filter_by(id=claims["id"]).scalar()
+        if version != claims["version"]:
+            return None
+        return TokenUser(**claims)
+    return load_user(f"{claims['id']}:{claims['version']}")
+
+
+class VersionedUserMixin(UserMixin):
+    """Mixin for the classes of logged in users, whose session holds the user's version along with the id"""
+
+    def get_id(self):
+        """Method for Flask login manager that returns the value stored in the session to load the user"""
 
+        return f"{self.id}:{self.version}"
 
-class User(db.Model, UserMixin):
+
+class User(db.Model, VersionedUserMixin):
     """Model that represents users"""
 
     id = db.Column(db.Integer, primary_key=True)
@@ -32,6 +113,8 @@ class User(db.Model, UserMixin):
         default=None,
     )
     reset_token = db.Column(db.String(100), default=None)
+    # Incremented whenever the user's credentials change, to invalidate auth tokens issued before
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
     # Relationships
     current_planet = db.relationship(
         "Planet",
@@ -57,12 +140,65 @@ class User(db.Model, UserMixin):
         # Query the database for user by given email
         user = User.query.filter_by(email=email).first()
         # Verify user exists in db and that the given password matches (short-cirtcuit condition)
-        if user and bcrypt.check_password_hash(user.password, password):
+        if user and check_password(user.password, password):
+            # Rehash password if it was hashed at a different cost than the configured one
+            if needs_rehash(user.password):
+                user.password = hash_password(password)
+                db.session.commit()
+            return user
+        return False
+
+    @staticmethod
+    async def verify_credentials_async(session, email, password):
+        """Static method that verifies user credentials in async views, with the view's session"""
+
+        result = await session.execute(select(User).filter_by(email=email).limit(1))
+        user = result.scalars().first()
+        if user and await check_password_async(user.password, password):
+            # Rehash password if it was hashed at a different cost than the configured one
+            if needs_rehash(user.password):
+                user.password = await hash_password_async(password)
+                await session.commit()
             return user
         return False
 
+    def bump_version(self):
+        """Method that invalidates the auth tokens issued to the user so far"""
+
+        self.version = self.version + 1
+
+    def get_auth_token(self):
+        """Method that returns a signed token to authenticate API requests without a session.
+        The token holds the user's id, exploration state and version, and expires after AUTH_TOKEN_MAX_AGE seconds."""
+
+        auth_token_serializer = URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
+        return auth_token_serializer.dumps(
+            {
+                "id": self.id,
+                "current_planet_id": self.current_planet_id,
+                "current_discovery_id": self.current_discovery_id,
+                "version": self.version,
+            },
+            salt="auth-token-salt",
+        )
+
+    @staticmethod
+    def verify_auth_token(token):
+        """Static method to verify an auth token.
+        If verified, the method returns the claims stored in the token, otherwise None."""
+
+        auth_token_serializer = URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
+        try:
+            return auth_token_serializer.loads(
+                token,
+                salt="auth-token-salt",
+                max_age=current_app.config["AUTH_TOKEN_MAX_AGE"],
+            )
+        except BadData:
+            return None
+
     def send_password_reset_email(self):
-        """Method that sends a reset email to the user.
+        """Method that queues a reset email to the user.
         The email contains a URL with a timed token associated with the user."""
 
         password_reset_serializer = URLSafeTimedSerializer(
@@ -71,7 +207,6 @@ class User(db.Model, UserMixin):
         token = password_reset_serializer.dumps(self.id, salt="password-reset-salt")
         # Store most recent reset token in db
         self.reset_token = token
-        db.session.commit()
         msg = Message("Password Reset Request", recipients=[self.email])
         msg.html = render_template(
             "reset_email.html",
@@ -79,7 +214,9 @@ class User(db.Model, UserMixin):
                 "users.reset_password", token=token, _external=True
             ),
         )
-        mail.send(msg)
+        # Queue email to be sent outside of the request
+        mail_queue.enqueue(msg)
+        db.session.commit()
 
     @staticmethod
     def verify_reset_token(token):
@@ -110,13 +247,75 @@ class User(db.Model, UserMixin):
         return f"<User id={self.id}, email={self.email}>"
 
 
+class UserIdentity(VersionedUserMixin):
+    """Class that represents a logged in user loaded from the user cache, with the user's identity only.
+    Views that use the user's exploration state must be marked with exploration_state to get a User instead."""
+
+    def __init__(self, id, email, version):
+        self.id = id
+        self.email = email
+        self.version = version
+
+    def __repr__(self):
+        return f"<UserIdentity id={self.id}, version={self.version}>"
+
+
+class TokenUser(VersionedUserMixin):
+    """Class that represents a user authenticated by an auth token, built from its claims without querying the db.
+    Only used in views marked as read only, which may see an exploration state as old as the token."""
+
+    def __init__(self, id, current_planet_id, current_discovery_id, version):
+        self.id = id
+        self.current_planet_id = current_planet_id
+        self.current_discovery_id = current_discovery_id
+        self.version = version
+
+    @property
+    def current_planet(self):
+        """Property that queries the planet being explored, if any"""
+
+        if self.current_planet_id is None:
+            return None
+        return Planet.query.get(self.current_planet_id)
+
+    def __repr__(self):
+        return f"<TokenUser id={self.id}, version={self.version}>"
+
+
 class Planet(db.Model):
     """Model that represents discovered planets"""
 
+    # Possible values of the status column
+    EXPLORING = "exploring"
+    ARCHIVED = "archived"
+
+    __table_args__ = (
+        # Index to list a user's planets ordered by id
+        db.Index("ix_planet_user_id_id", "user_id", "id"),
+        # Partial index to list a user's archived planets (archive keyset pagination)
+        db.Index(
+            "ix_planet_user_id_id_archived",
+            "user_id",
+            "id",
+            postgresql_where=db.text("status = 'archived'"),
+            sqlite_where=db.text("status = 'archived'"),
+        ),
+        # SQLite reuses the id of the last deleted row otherwise, which would reuse cache keys
+        {"sqlite_autoincrement": True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), default="Unnamed Planet")
     things_to_discover = db.Column(db.Integer, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # Columns that represent the state of the planet, set to archived once the planet is named
+    status = db.Column(
+        db.String(10), nullable=False, default=EXPLORING, server_default=EXPLORING
+    )
+    # Null for planets archived before archive times were recorded, which have no time to backfill it from
+    archived_at = db.Column(db.DateTime, default=None)
+    # Incremented whenever the planet or its discoveries change, to invalidate cached pages
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
     # Relationships
     # User associated with planet
     explorer = db.relationship(
@@ -133,20 +332,37 @@ class Planet(db.Model):
         cascade="all, delete",
         lazy=True,
     )
+    # Logged discoveries associated with planet, ordered by number (read only)
+    logged_discoveries = db.relationship(
+        "Discovery",
+        primaryjoin="and_(Planet.id == Discovery.planet_id, Discovery.description != None)",
+        order_by="Discovery.number",
+        viewonly=True,
+    )
 
-    def generate_prompt(self):
-        circumstances = choice(constants.CIRCUMSTANCES)
-        while True:
-            thing_discovered = (
-                f"{choice(constants.CATEGORIES)} {choice(constants.LOCATIONS)}"
-            )
-            if not Discovery.query.filter_by(
-                planet_id=self.id,
-                thing_discovered=thing_discovered,
-            ).first():
-                break
+    def generate_prompt(self, rng=random):
+        """Method that generates a random prompt for the next discovery on the planet.
+        Things already discovered on the planet are loaded in a single query and excluded.
+        Raises PromptsExhausted if there is nothing left to discover."""
+
+        used = {
+            thing_discovered
+            for (thing_discovered,) in db.session.query(
+                Discovery.thing_discovered
+            ).filter_by(planet_id=self.id)
+        }
+        return draw_prompt(used, rng)
+
+    def archive(self):
+        """Method that marks the planet as archived"""
+
+        self.status = Planet.ARCHIVED
+        self.archived_at = datetime.utcnow()
 
-        return circumstances, thing_discovered
+    def bump_version(self):
+        """Method that marks the planet and its discoveries as changed"""
+
+        self.version = self.version + 1
 
     def __repr__(self):
         return f"<Planet id={self.id}, name={self.name}, things_to_discover={self.things_to_discover}>"
@@ -155,6 +371,11 @@ class Planet(db.Model):
 class Discovery(db.Model):
     """Model that represents discoveries"""
 
+    # Each planet has a single discovery per number
+    __table_args__ = (
+        db.Index("ix_discovery_planet_id_number", "planet_id", "number", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.Integer, nullable=False)
     circumstances = db.Column(db.String(40), nullable=False)
@@ -0,0 +1,431 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import (
+    abort,
+    before_render_template,
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+    Response,
+    template_rendered,
+)
+import hmac
+import json
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+import sys
+from threading import Lock
+import time
+
+# Upper bounds in seconds of the request duration histogram buckets
+REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class TimedQueuePool(QueuePool):
+    """Connection pool that records how long requests wait to check out a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Counters are updated by every thread of the worker
+        self._stats_lock = Lock()
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait_time = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time_total += wait_time
+                self.wait_time_max = max(self.wait_time_max, wait_time)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    """Event listener that counts the SQL statements executed during a request"""
+
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+def query_count():
+    """Function that returns the number of SQL statements executed so far in the current request"""
+
+    return g.get("query_count", 0)
+
+
+def init_query_counter(app):
+    """Function that exposes the per-request query count in an X-Query-Count response header.
+    The header is only added in debug mode or when QUERY_COUNT_HEADER is enabled."""
+
+    @app.after_request
+    def add_query_count_header(response):
+        if current_app.debug or current_app.config["QUERY_COUNT_HEADER"]:
+            response.headers["X-Query-Count"] = str(query_count())
+        return response
+
+
+def pool_stats(engine):
+    """Function that returns the state of an engine's connection pool"""
+
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                wait_ms_total=round(pool.wait_time_total * 1000, 3),
+                wait_ms_max=round(pool.wait_time_max * 1000, 3),
+            )
+    return stats
+
+
+def init_pool_logging(app):
+    """Function that logs the connection pool state at most every DB_POOL_LOG_INTERVAL seconds.
+    Logging is disabled when the interval is 0."""
+
+    interval = app.config["DB_POOL_LOG_INTERVAL"]
+    if not interval:
+        return
+    last_logged = [0.0]
+
+    @app.after_request
+    def log_pool_stats(response):
+        now = time.monotonic()
+        if now - last_logged[0] >= interval:
+            last_logged[0] = now
+            # Imported here to avoid importing the app package from config
+            from captains_log import db
+
+            stats = " ".join(
+                f"{key}={value}" for key, value in pool_stats(db.engine).items()
+            )
+            current_app.logger.info(f"db pool {stats}")
+        return response
+
+
+class Metrics:
+    """Class that aggregates request durations and time spent per component in this process.
+    Each gunicorn worker keeps its own metrics."""
+
+    def __init__(self):
+        self._lock = Lock()
+        # (endpoint, method, status) -> number of requests
+        self.requests = {}
+        # endpoint -> [count per bucket..., count above last bucket, sum of durations]
+        self.durations = {}
+        # (component, endpoint) -> [seconds, calls]
+        self.components = {}
+
+    def observe_request(self, endpoint, method, status, seconds, timings):
+        """Method that adds a finished request and the timings of its components"""
+
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.setdefault(
+                endpoint, [0] * (len(REQUEST_DURATION_BUCKETS) + 1) + [0.0]
+            )
+            histogram[bisect_left(REQUEST_DURATION_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+            for component, (component_seconds, calls) in timings.items():
+                self._add_component(component, endpoint, component_seconds, calls)
+
+    def observe_component(self, component, endpoint, seconds, calls=1):
+        """Method that adds time spent in a component outside of a request"""
+
+        with self._lock:
+            self._add_component(component, endpoint, seconds, calls)
+
+    def _add_component(self, component, endpoint, seconds, calls):
+        total = self.components.setdefault((component, endpoint), [0.0, 0])
+        total[0] += seconds
+        total[1] += calls
+
+    def render(self):
+        """Method that returns the metrics in the Prometheus text exposition format"""
+
+        def labels(**values):
+            escaped = (
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n")
+                for value in values.values()
+            )
+            pairs = ",".join(
+                f'{name}="{value}"' for name, value in zip(values, escaped)
+            )
+            return "{" + pairs + "}"
+
+        lines = [
+            "# HELP captains_log_requests_total Requests handled by this process.",
+            "# TYPE captains_log_requests_total counter",
+        ]
+        with self._lock:
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    "captains_log_requests_total"
+                    f"{labels(endpoint=endpoint, method=method, status=status)} {count}"
+                )
+            lines += [
+                "# HELP captains_log_request_duration_seconds Request durations.",
+                "# TYPE captains_log_request_duration_seconds histogram",
+            ]
+            for endpoint, histogram in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(
+                    REQUEST_DURATION_BUCKETS + ("+Inf",), histogram[:-1]
+                ):
+                    cumulative += count
+                    lines.append(
+                        "captains_log_request_duration_seconds_bucket"
+                        f"{labels(endpoint=endpoint, le=bound)} {cumulative}"
+                    )
+                lines += [
+                    "captains_log_request_duration_seconds_sum"
+                    f"{labels(endpoint=endpoint)} {histogram[-1]:.6f}",
+                    "captains_log_request_duration_seconds_count"
+                    f"{labels(endpoint=endpoint)} {cumulative}",
+                ]
+            lines += [
+                "# HELP captains_log_component_seconds_total Time spent in SQL, Jinja, bcrypt and mail.",
+                "# TYPE captains_log_component_seconds_total counter",
+            ]
+            for (component, endpoint), (seconds, _) in sorted(self.components.items()):
+                lines.append(
+                    "captains_log_component_seconds_total"
+                    f"{labels(component=component, endpoint=endpoint)} {seconds:.6f}"
+                )
+            lines += [
+                "# HELP captains_log_component_calls_total SQL statements, templates rendered, hashes and mail batches.",
+                "# TYPE captains_log_component_calls_total counter",
+            ]
+            for (component, endpoint), (_, calls) in sorted(self.components.items()):
+                lines.append(
+                    "captains_log_component_calls_total"
+                    f"{labels(component=component, endpoint=endpoint)} {calls}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def record(component, seconds):
+    """Function that adds time spent in a component to the current request's timings.
+    Outside of a request, the time is added to the app's metrics under the "background" endpoint."""
+
+    if has_request_context() and "timings" in g:
+        timing = g.timings.setdefault(component, [0.0, 0])
+        timing[0] += seconds
+        timing[1] += 1
+    elif has_app_context() and "metrics" in current_app.extensions:
+        current_app.extensions["metrics"].observe_component(
+            component, "background", seconds
+        )
+
+
+@contextmanager
+def timed(component):
+    """Context manager that records the time spent in its block as a component of the request.
+    Does nothing unless INSTRUMENTATION is enabled."""
+
+    if not (has_app_context() and current_app.config["INSTRUMENTATION"]):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(component, time.perf_counter() - start)
+
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Event listener that records when a SQL statement starts executing"""
+
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Event listener that records the time a SQL statement took"""
+
+    record("sql", time.perf_counter() - conn.info["query_start"].pop())
+
+
+def start_render_timer(app, template, context, **extra):
+    """Signal handler that records when a template starts rendering"""
+
+    if "timings" in g:
+        g.setdefault("render_start", []).append(time.perf_counter())
+
+
+def stop_render_timer(app, template, context, **extra):
+    """Signal handler that records the time a template took to render.
+    Templates rendered from within another template are counted as part of the outer one."""
+
+    starts = g.get("render_start")
+    if starts:
+        start = starts.pop()
+        if not starts:
+            record("jinja", time.perf_counter() - start)
+
+
+def init_instrumentation(app):
+    """Function that times SQL statements, template rendering, password hashing and email sending per request.
+    Timings are sent in a Server-Timing header, logged as JSON and aggregated at /internal/metrics
+    in the Prometheus text format. Nothing is registered unless INSTRUMENTATION is enabled."""
+
+    if not app.config["INSTRUMENTATION"]:
+        return
+    metrics = app.extensions["metrics"] = Metrics()
+
+    # Engine listeners are global, so they are registered once for every app in the process
+    if not event.contains(Engine, "before_cursor_execute", start_query_timer):
+        event.listen(Engine, "before_cursor_execute", start_query_timer)
+        event.listen(Engine, "after_cursor_execute", stop_query_timer)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(stop_render_timer, app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.timings = {}
+
+    @app.after_request
+    def report_timings(response):
+        if "timings" not in g:
+            return response
+        duration = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or "unmatched"
+        response.headers["Server-Timing"] = ", ".join(
+            [
+                f'{component};dur={seconds * 1000:.2f};desc="{calls}x"'
+                for component, (seconds, calls) in g.timings.items()
+            ]
+            + [f"total;dur={duration * 1000:.2f}"]
+        )
+        metrics.observe_request(
+            endpoint, request.method, response.status_code, duration, g.timings
+        )
+        entry = {
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 2),
+        }
+        for component, (seconds, calls) in g.timings.items():
+            entry[f"{component}_ms"] = round(seconds * 1000, 2)
+            entry[f"{component}_calls"] = calls
+        current_app.logger.info(json.dumps(entry))
+        return response
+
+    def metrics_view():
+        """View to expose the aggregated metrics of this process to Prometheus.
+        METRICS_TOKEN must be sent as a bearer token. Without a token, metrics are only served
+        in debug or testing, and other environments get a 404."""
+
+        token = current_app.config["METRICS_TOKEN"]
+        if not token:
+            if not (current_app.debug or current_app.testing):
+                abort(404)
+        elif not hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            abort(403)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/internal/metrics", "metrics", metrics_view)
+
+
+class LazyLoadError(Exception):
+    """Exception raised when a relationship is lazy loaded more times than allowed in a single request"""
+
+
+def lazy_load_location():
+    """Function that returns the template line, or the line of the app's code, that triggered a lazy load"""
+
+    package = os.path.dirname(__file__)
+    frame = sys._getframe(1)
+    while frame is not None:
+        # Compiled templates keep a reference to their template, which maps lines back to the source
+        template = frame.f_globals.get("__jinja_template__")
+        if template is not None:
+            return (
+                f"{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}"
+            )
+        filename = frame.f_code.co_filename
+        if filename.startswith(package) and filename != __file__:
+            return f"{os.path.relpath(filename, package)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def count_lazy_load(orm_execute_state):
+    """Event listener that counts the lazy loads of each relationship during a request"""
+
+    if (
+        not has_request_context()
+        or "lazy_loads" not in g
+        or not orm_execute_state.is_select
+        or orm_execute_state.lazy_loaded_from is None
+    ):
+        return
+    relationship = str(orm_execute_state.loader_strategy_path.prop)
+    locations = g.lazy_loads.setdefault(relationship, {})
+    location = lazy_load_location()
+    locations[location] = locations.get(location, 0) + 1
+
+
+def init_lazy_load_detection(app):
+    """Function that reports relationships lazy loaded more than LAZY_LOAD_THRESHOLD times in a request,
+    which usually means a loop over objects is missing an eager load.
+    With LAZY_LOAD_DETECTION set to "warn" the report is logged, with "raise" a LazyLoadError is raised,
+    which fails any test client request. Nothing is registered when it isn't set."""
+
+    mode = app.config["LAZY_LOAD_DETECTION"]
+    if not mode:
+        return
+    if mode not in ("warn", "raise"):
+        raise ValueError(f"Unknown lazy load detection mode: {mode}")
+
+    # Session listeners are global, so the listener is registered once for every app in the process
+    if not event.contains(Session, "do_orm_execute", count_lazy_load):
+        event.listen(Session, "do_orm_execute", count_lazy_load)
+
+    @app.before_request
+    def start_lazy_load_count():
+        g.lazy_loads = {}
+
+    @app.after_request
+    def check_lazy_loads(response):
+        threshold = current_app.config["LAZY_LOAD_THRESHOLD"]
+        for relationship, locations in g.get("lazy_loads", {}).items():
+            count = sum(locations.values())
+            if count <= threshold:
+                continue
+            sources = ", ".join(
+                f"{location} ({times}x)" for location, times in locations.items()
+            )
+            message = (
+                f"{relationship} was lazy loaded {count} times in {request.method} "
+                f"{request.path} ({request.endpoint}), from {sources}"
+            )
+            if mode == "raise":
+                raise LazyLoadError(message)
+            current_app.logger.warning(message)
+        return response
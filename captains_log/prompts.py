@@ -0,0 +1,26 @@
+import captains_log.constants as constants
+from itertools import product
+import random
+
+# Every possible thing to discover, built once from the category and location constants
+THINGS_DISCOVERED = tuple(
+    f"{category} {location}"
+    for category, location in product(constants.CATEGORIES, constants.LOCATIONS)
+)
+
+
+class PromptsExhausted(Exception):
+    """Exception raised when every thing to discover has already been used on a planet"""
+
+
+def draw_prompt(used, rng=random):
+    """Function that draws a random discovery prompt, excluding things already discovered.
+    Returns a tuple of circumstances and thing discovered.
+    An optional seeded random.Random instance can be passed to make draws reproducible."""
+
+    # Keep the order of the precomputed tuple so seeded draws are deterministic
+    remaining = [thing for thing in THINGS_DISCOVERED if thing not in used]
+    if not remaining:
+        raise PromptsExhausted("There is nothing left to discover on this planet.")
+
+    return rng.choice(constants.CIRCUMSTANCES), rng.choice(remaining)
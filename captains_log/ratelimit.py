@@ -0,0 +1,207 @@
+from captains_log.shared_memory import SlotTable
+from collections import OrderedDict
+from flask import current_app, request
+from functools import wraps
+import hashlib
+import math
+import struct
+from threading import Lock
+import time
+from werkzeug.exceptions import TooManyRequests
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Longest valid email address, longer ones are truncated before being used as a key
+EMAIL_MAX_LENGTH = 254
+
+
+def take_token(state, capacity, rate, now):
+    """Function that takes a token from a bucket holding up to capacity tokens and refilled with rate tokens per second.
+    state is the (tokens, updated_at) of the bucket, or None for a full bucket.
+    Returns the new state and 0, or the seconds to wait until a token is available if the bucket is empty."""
+
+    tokens, updated_at = state if state is not None else (capacity, now)
+    # Clocks going backwards don't drain the bucket
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryStorage:
+    """Rate limit storage that keeps buckets in the worker process.
+    Once maxsize buckets are stored, the least recently used one is evicted in constant time."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, capacity, rate):
+        with self._lock:
+            state, retry_after = take_token(
+                self._buckets.get(key), capacity, rate, time.time()
+            )
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class SharedMemoryStorage:
+    """Rate limit storage that keeps buckets in a table of slots shared by every worker of the host.
+    Slots are indexed by a hash of the key, keyed with a secret so that clients can't choose keys that share a slot.
+    Keys that still share one also share its bucket, so a key never refills the bucket of another one."""
+
+    # Tokens, updated_at. An empty slot is a bucket that was refilled long ago.
+    SLOT = struct.Struct("<dd")
+
+    def __init__(self, path, secret, slots=65536):
+        self.table = SlotTable(path, self.SLOT, slots)
+        # Keys of blake2b are limited to 64 bytes
+        self.secret = hashlib.sha256(secret.encode("utf-8")).digest()
+
+    def take(self, key, capacity, rate):
+        digest = hashlib.blake2b(
+            key.encode("utf-8"), digest_size=8, key=self.secret
+        ).digest()
+        return self.table.update(
+            int.from_bytes(digest, "little"),
+            lambda state: take_token(state, capacity, rate, time.time()),
+        )
+
+
+class RedisStorage:
+    """Rate limit storage that keeps buckets in a Redis-compatible server shared by all workers and hosts.
+    Buckets are updated atomically by a Lua script, and expire once they would be full again."""
+
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate))
+return tostring(retry_after)
+"""
+
+    def __init__(self, url, prefix="captains_log:ratelimit:"):
+        if redis is None:
+            raise RuntimeError(
+                "The redis package is required for the redis rate limit storage."
+            )
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, rate):
+        return float(
+            self._take(keys=[self.prefix + key], args=[capacity, rate, time.time()])
+        )
+
+
+class RateLimiter:
+    """Extension that limits the rate of requests with token buckets.
+    The storage is chosen by RATELIMIT_STORAGE: "memory" (default) keeps buckets per worker,
+    "shared" shares them between the workers of a host, "redis" between hosts and "null" disables rate limiting."""
+
+    def __init__(self, app=None):
+        self.storage = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        storage = app.config["RATELIMIT_STORAGE"]
+        if storage == "memory":
+            self.storage = MemoryStorage(app.config["RATELIMIT_MEMORY_SIZE"])
+        elif storage == "shared":
+            self.storage = SharedMemoryStorage(
+                app.config["RATELIMIT_SHARED_PATH"],
+                app.config["SECRET_KEY"],
+                app.config["RATELIMIT_SHARED_SLOTS"],
+            )
+        elif storage == "redis":
+            self.storage = RedisStorage(app.config["RATELIMIT_REDIS_URL"])
+        elif storage == "null":
+            self.storage = None
+        else:
+            raise ValueError(f"Unknown rate limit storage: {storage}")
+
+    def take(self, key, limit):
+        """Method that takes a token from the bucket of a key. limit is a tuple of (requests, seconds).
+        Returns 0 if the request is allowed, otherwise the seconds to wait before retrying."""
+
+        if self.storage is None:
+            return 0
+        requests, seconds = limit
+        return self.storage.take(key, requests, requests / seconds)
+
+
+rate_limiter = RateLimiter()
+
+
+def request_email():
+    """Function that returns the normalized email address sent in a form or a JSON body, or None"""
+
+    if request.is_json:
+        body = request.get_json(silent=True)
+        email = body.get("email") if isinstance(body, dict) else None
+    else:
+        email = request.form.get("email")
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return email.strip().lower()[:EMAIL_MAX_LENGTH]
+
+
+def rate_limited(name):
+    """Decorator for views that limit POST requests per client IP address and per email address,
+    with the limits set by RATELIMIT_<NAME>_PER_IP and RATELIMIT_<NAME>_PER_EMAIL.
+    Requests over either limit get a 429 before the view runs, so they don't cost a db query,
+    a password hash or an email."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == "POST":
+                config = current_app.config
+                buckets = [
+                    (
+                        f"{name}:ip:{request.remote_addr}",
+                        config[f"RATELIMIT_{name.upper()}_PER_IP"],
+                    )
+                ]
+                email = request_email()
+                if email is not None:
+                    buckets.append(
+                        (
+                            f"{name}:email:{email}",
+                            config[f"RATELIMIT_{name.upper()}_PER_EMAIL"],
+                        )
+                    )
+                retry_after = max(
+                    rate_limiter.take(key, limit) for key, limit in buckets
+                )
+                if retry_after:
+                    raise TooManyRequests(
+                        "Too many attempts. Please wait a moment and try again.",
+                        retry_after=math.ceil(retry_after),
+                    )
+            # Async views are run until they return, as login_required does
+            return current_app.ensure_sync(view)(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
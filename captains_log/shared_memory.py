@@ -0,0 +1,60 @@
+import mmap
+import os
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SlotTable:
+    """Table of fixed size slots in a file mapped in memory by every worker of the host, e.g. in /dev/shm.
+    slot is the struct.Struct of a slot, and a slot is locked while it's read or written.
+    Without a path, the table is kept in the process, which is only meant for tests and benchmarks."""
+
+    def __init__(self, path, slot, slots=65536):
+        if path is not None and fcntl is None:
+            raise RuntimeError(
+                "Tables shared between workers are only available on Unix systems."
+            )
+        self.path = path
+        self.slot = slot
+        self.slots = slots
+        self._fd = None
+        self._map = None
+        self._lock = Lock()
+
+    def _open(self):
+        """Method that maps the file in memory, creating it if needed.
+        It's opened on first use, after gunicorn forked the workers."""
+
+        size = self.slots * self.slot.size
+        if self.path is None:
+            self._map = mmap.mmap(-1, size)
+            return
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def update(self, index, function):
+        """Method that calls function with the values of a slot while it's locked. Slots start as zeros.
+        function returns the values to store in the slot, or None to leave it unchanged, and a result.
+        Returns the result."""
+
+        offset = index % self.slots * self.slot.size
+        # Record locks are held per process, so threads of a worker also take a lock
+        with self._lock:
+            if self._map is None:
+                self._open()
+            if self._fd is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot.size, offset)
+            try:
+                values, result = function(self.slot.unpack_from(self._map, offset))
+                if values is not None:
+                    self.slot.pack_into(self._map, offset, *values)
+            finally:
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot.size, offset)
+        return result
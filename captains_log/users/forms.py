@@ -10,12 +10,19 @@ from wtforms import (
 )
 
 
+def normalize_email(email):
+    """Filter that normalizes email addresses to match the lowercased emails stored in db"""
+
+    return email.strip().lower() if email else email
+
+
 class RegistrationForm(FlaskForm):
     """WTForm class to register users"""
 
     email = EmailField(
         "Email",
         [validators.DataRequired(), validators.Email()],
+        filters=[normalize_email],
         render_kw={"autofocus": True},
     )
     password = PasswordField(
@@ -52,6 +59,7 @@ class LoginForm(FlaskForm):
     email = EmailField(
         "Email",
         [validators.DataRequired(), validators.Email()],
+        filters=[normalize_email],
         render_kw={"autofocus": True},
     )
     password = PasswordField("Password", [validators.DataRequired()])
@@ -65,15 +73,17 @@ class RequestResetForm(FlaskForm):
     email = EmailField(
         "Email",
         [validators.DataRequired(), validators.Email()],
+        filters=[normalize_email],
         render_kw={"autofocus": True},
     )
     submit = SubmitField("Send Reset Email")
 
     def validate_email(self, email):
-        """Custom validator to make sure email address is in db"""
+        """Custom validator to make sure email address is in db.
+        The user found is kept in the form, to be used by the view."""
 
-        user = User.query.filter_by(email=email.data).first()
-        if user is None:
+        self.user = User.query.filter_by(email=email.data).first()
+        if self.user is None:
             raise ValidationError(
                 "There is no account with the provided email address."
             )
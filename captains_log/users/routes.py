@@ -1,5 +1,8 @@
-from captains_log import bcrypt, db
+from captains_log import db, user_cache
+from captains_log.asyncdb import async_db, async_version
+from captains_log.hashing import hash_password
 from captains_log.models import User
+from captains_log.ratelimit import rate_limited
 from captains_log.users.forms import (
     LoginForm,
     RegistrationForm,
@@ -8,6 +11,7 @@ from captains_log.users.forms import (
 )
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_user, logout_user
+from sqlalchemy.exc import IntegrityError
 
 # Initialize Blueprint
 users = Blueprint("users", __name__)
@@ -25,12 +29,16 @@ def register():
     form = RegistrationForm()
     # If form validated, hash password and create user in db
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        hashed_password = hash_password(form.password.data)
         user = User(email=form.email.data, password=hashed_password)
         db.session.add(user)
-        db.session.commit()
+        # Rely on the unique index in case the email was registered since validation
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            form.email.errors.append("This email address is already registered.")
+            return render_template("register.html", form=form)
 
         flash("Your account has been created.", "success")
         # Login registered user
@@ -43,6 +51,7 @@ def register():
 
 
 @users.route("/login", methods=["GET", "POST"])
+@rate_limited("login")
 def login():
     """View to handle user login"""
 
@@ -74,6 +83,43 @@ def login():
     return render_template("login.html", form=form)
 
 
+@async_version(users, "login")
+@rate_limited("login")
+async def login_async():
+    """View to handle user login, querying the db with the asyncio engine and checking the password
+    without blocking the event loop"""
+
+    # Make sure user isn't logged in
+    if current_user.is_authenticated:
+        return redirect(url_for("main.index"))
+
+    # Create WTForm to login user
+    form = LoginForm()
+    # If form validated, try to login
+    if form.validate_on_submit():
+        # Verify user's credentials
+        async with async_db.session() as session:
+            user = await User.verify_credentials_async(
+                session, form.email.data, form.password.data
+            )
+        # If credentials are correct, login user
+        if user:
+            login_user(user, remember=form.remember.data)
+            flash("You logged in successfully.", "success")
+            # Get next page to redirect after login
+            next_page = request.args.get("next")
+            if next_page:
+                return redirect(next_page)
+            # If there is no next page, redirect to index
+            return redirect(url_for("main.index"))
+        # If credentials aren't correct, redirect with flash message
+        else:
+            flash("Login unsuccessful. Please check your credentials.", "danger")
+
+    # If page was reached by GET method, render page with login form
+    return render_template("login.html", form=form)
+
+
 @users.route("/logout")
 def logout():
     """View to handle user logout"""
@@ -83,6 +129,7 @@ def logout():
 
 
 @users.route("/reset_password", methods=["GET", "POST"])
+@rate_limited("reset")
 def reset_request():
     """View to handle requests to reset password"""
 
@@ -94,8 +141,8 @@ def reset_request():
     form = RequestResetForm()
     # If form validated, send reset link to user's email
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        user.send_password_reset_email()
+        # User was already queried when validating the form
+        form.user.send_password_reset_email()
         flash(
             "An email has been sent with instructions to reset your password.",
             "success",
@@ -125,11 +172,12 @@ def reset_password(token):
     form = ResetPasswordForm()
     # If form validated, hash password, reset current token and update in db
     if form.validate_on_submit():
-        user.password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        user.password = hash_password(form.password.data)
         user.reset_token = None
+        # Invalidate sessions and auth tokens created with the old password
+        user.bump_version()
         db.session.commit()
+        user_cache.invalidate(user)
         flash("Your password has been updated.", "success")
         return redirect(url_for("users.login"))
 
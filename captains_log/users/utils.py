@@ -0,0 +1,6 @@
+def exploration_state(view):
+    """Decorator for views that read or change the current user's exploration state.
+    They get the user loaded from the db, while other views may get the user's identity from the user cache."""
+
+    view.exploration_state = True
+    return view
@@ -0,0 +1,22 @@
+# Gunicorn configuration, loaded automatically from the project's root folder
+import os
+
+# Each worker process serves requests from a pool of threads, so that a request waiting on the database,
+# SMTP or the password hashing processes holds a thread instead of a whole process.
+# Each thread may hold a database connection: keep DB_POOL_SIZE + DB_MAX_OVERFLOW at least this high.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def post_fork(server, worker):
+    """Drop the database connections inherited from the master process, without closing them.
+    Needed when the app is preloaded (--preload), so that workers don't share sockets,
+    and closing them would close the connections that the master process still holds."""
+
+    from captains_log import db
+
+    app = worker.app.wsgi()
+    # The Flask app is wrapped when served from asgi.py
+    app = getattr(app, "wsgi_application", app)
+    with app.app_context():
+        db.engine.dispose(close=False)